@@ -10,144 +10,130 @@ import pandas as pd
 import numpy as np
 import pvlib
 
-from RunSim import RunSim
+from simulationContext import SimulationContext
+from orientationOptimiser import OptimizationData, surrogateOptimise, multiStartOptimise
+from energyMetrics import selfConsumption
 import matplotlib.pyplot as plt
 
 from pvlib.location import Location
 from my_functions import generateWeather, averageConsumptionData
+from componentCatalog import loadCatalog
 
 import warnings
 
 # supressing shapely warnings that occur on import of pvfactors
 warnings.filterwarnings(action='ignore', module='pvfactors')
 
-# Set up user inputs
-latitude = 56.82626812132033
-longitude = -5.787276786944142
-season = "Year"   #Summer, Winter, Spring, Autumn, Year
-
-# Import weather data to speed up sim.
-if season == "Winter":
-    start = '2021-01-01'
-    end = '2021-02-28'
-elif season == "Summer":
-    start = '2021-06-01'
-    end = '2021-08-31'
-else:
-    season = "Year"
-    start = '2021-01-01'
-    end = '2021-12-31'
-
-site = Location(latitude=latitude, longitude=longitude, name='Case Study Site') #UTC
-times = pd.date_range(start, end, freq='1min',tz=site.tz)
-year=times.year[0]
-weatherSource = 'tmy'
-weatherData = generateWeather(weatherSource,site,times,year)
-averageConsumptionData = averageConsumptionData(weatherData.index)
-
-sandiaModules = pvlib.pvsystem.retrieve_sam('SandiaMod')
-cecModules = pvlib.pvsystem.retrieve_sam(path = 'https://raw.githubusercontent.com/NREL/SAM/patch/deploy/libraries/CEC%20Modules.csv')
-cecInverters = pvlib.pvsystem.retrieve_sam('CECInverter')
-
-consumption = averageConsumptionData.loc[start:end][0]
-weatherData = weatherData.loc[start:end]
-
-args = []
-args.append('Bifacial')
-args.append(weatherData)
-args.append(site)
-args.append(sandiaModules)
-args.append(cecModules)
-args.append(cecInverters)
-args.append(consumption)
-
 # Genreate objective function for optimiser. Function returns total generation
 def objFGeneration(variables,args):
     """objective function, to be solved."""
     # Unpack tuples
     tilt,azimuth = variables[0],variables[1]    
-    faciality,weatherData,site,sandiaModules,cecModules,cecInverters = args[0],args[1],args[2],args[3],args[4],args[5]
+    context = args[7]
     
     # Run sim
-    energy,dc,allRes = RunSim(tilt,azimuth,faciality,weatherData,site,
-                          sandiaModules,cecModules,cecInverters)
+    energy,series = context.evaluate(tilt,azimuth)
     print(tilt,azimuth,energy)
     return -energy
 
-initial_guess = [60,180]  # initial guess can be anything
-bnds = ((0,90),(0,360))
-
-
-###########
-    # Create object to store optimisation results
-class OptimizationData:
-    def __init__(self):
-        self.iter_values = []
-    
-    def record_iteration(self, energy):
-        self.iter_values.append(energy)
-            
-ntests=100
-fig,ax = plt.subplots(figsize=(10,6))
-for test in range(ntests):
-    ti = np.random.uniform(0,90)
-    az = np.random.uniform(0,360)
-    initial_guess = [ti,az] 
-    # Create an instance of OptimizationData
-    optimizer_data = OptimizationData()
-    
-    # Define a callback function to record iteration results
-    def callback_function(variables):
-        tilt, azimuth = variables
-        energy = -objFGeneration(variables, args)
-        optimizer_data.record_iteration(energy)
-    
-    # Perform unconstrained optimization
-    result = spo.minimize(
-        objFGeneration,
-        initial_guess,
-        args=args,
-        bounds=bnds,
-        method='L-BFGS-B',  # Example method (you can choose other methods)
-        callback=callback_function
-    )
-    
-    # Plot convergence behavior
-    ax.plot(optimizer_data.iter_values, label=f'Test {test + 1}, Initial guess = ({initial_guess[0]:.1f},{initial_guess[1]:.1f})')
-ax.set_xlabel('Iteration')
-ax.set_ylabel('Objective Function Value (Total generation, Wh)')
-# ax.legend()
-plt.title('Convergence Plot')
-plt.show()
-
-# Print optimized tilt and azimuth
-print("Optimized Tilt:", result.x[0])
-print("Optimized Azimuth:", result.x[1])
-print("Optimized Energy:", -result.fun)  # Minimize -energy to maximize energy
-
-
-
 def objFNetEnergy(variables,args):
     """objective function, to be solved."""
     # Unpack tuples
     tilt,azimuth = variables[0],variables[1]
-    faciality,weatherData,site,sandiaModules,cecModules,cecInverters = args[0],args[1],args[2],args[3],args[4],args[5]
+    context = args[7]
     
     # Run sim
-    energy,dc,allRes = RunSim(tilt,azimuth,faciality,weatherData,site,
-                          sandiaModules,cecModules,cecInverters)
+    energy,series = context.evaluate(tilt,azimuth,returnSeries=True)
     consumption = args[6]
-    bools = allRes.ac>consumption
-    yaboy = [consumption.iloc[i] if bools.iloc[i] else allRes.ac.iloc[i] for i in np.arange(len(bools))]
-    SelfConsumption = pd.Series(data=yaboy, index=bools.index)
-    
-    SelfConsumption_total = sum(SelfConsumption)
+    SelfConsumption_total = selfConsumption(series['ac'],consumption)
     # print(tilt,azimuth,SelfConsumption_total)
     return -SelfConsumption_total
 
-bnds = ((0,90),(0,360))
-initial_guess = [45,180]  # initial guess can be anything
-result = spo.minimize(objFNetEnergy, initial_guess,args
-                        ,bounds = bnds
-                      )
-print(f"For a {args[0]} array over {season}:\n Total self consumption of {abs(result.fun)} from Optimal tilt = {result.x[0]}, Optimal azimuth = {result.x[1]}")
\ No newline at end of file
+if __name__ == '__main__':
+    # Set up user inputs
+    latitude = 56.82626812132033
+    longitude = -5.787276786944142
+    season = "Year"   #Summer, Winter, Spring, Autumn, Year
+
+    # Import weather data to speed up sim.
+    if season == "Winter":
+        start = '2021-01-01'
+        end = '2021-02-28'
+    elif season == "Summer":
+        start = '2021-06-01'
+        end = '2021-08-31'
+    else:
+        season = "Year"
+        start = '2021-01-01'
+        end = '2021-12-31'
+
+    site = Location(latitude=latitude, longitude=longitude, name='Case Study Site') #UTC
+    times = pd.date_range(start, end, freq='1min',tz=site.tz)
+    year=times.year[0]
+    weatherSource = 'tmy'
+    weatherData = generateWeather(weatherSource,site,times,year)
+    averageConsumptionData = averageConsumptionData(weatherData.index)
+
+    sandiaModules = loadCatalog('SandiaMod')
+    cecModules = loadCatalog('CECModules')
+    cecInverters = loadCatalog('CECInverter')
+
+    consumption = averageConsumptionData.loc[start:end][0]
+    weatherData = weatherData.loc[start:end]
+
+    args = []
+    args.append('Bifacial')
+    args.append(weatherData)
+    args.append(site)
+    args.append(sandiaModules)
+    args.append(cecModules)
+    args.append(cecInverters)
+    args.append(consumption)
+    # Components, site and weather are resolved once, each evaluation only changes the orientation
+    args.append(SimulationContext(args[0],weatherData,site,sandiaModules,cecModules,cecInverters))
+
+    initial_guess = [60,180]  # initial guess can be anything
+    bnds = ((0,90),(0,360))
+
+
+    ###########
+    # 'surrogate' fits an RBF surface to a few simulations, 'multistart' runs L-BFGS-B from random starts
+    optimiser = 'surrogate'
+    # Worker processes for the multistart restarts (None = all cores)
+    workers = None
+
+    ntests=100
+    fig,ax = plt.subplots(figsize=(10,6))
+    if optimiser == 'surrogate':
+        optimizer_data = OptimizationData()
+        result = surrogateOptimise(objFGeneration,bnds,args=args,data=optimizer_data)
+        print(f"Surrogate optimiser used {result.nfev} simulations")
+        ax.plot(optimizer_data.iter_values, label='Surrogate')
+    else:
+        # Independent restarts run in parallel, each worker memoising its simulations
+        starts = np.column_stack([np.random.uniform(0,90,ntests),np.random.uniform(0,360,ntests)])
+        result,restarts = multiStartOptimise(objFGeneration,bnds,starts,args=(args,),
+                                             key=(args[0],season),workers=workers)
+        print(f"Restarts used {sum(r.simulations for r in restarts)} simulations")
+        for test,restart in enumerate(restarts):
+            # Plot convergence behavior
+            ax.plot(restart.trace, label=f'Test {test + 1}, Initial guess = ({restart.x0[0]:.1f},{restart.x0[1]:.1f})')
+    ax.set_xlabel('Iteration')
+    ax.set_ylabel('Objective Function Value (Total generation, Wh)')
+    # ax.legend()
+    plt.title('Convergence Plot')
+    plt.show()
+
+    # Print optimized tilt and azimuth
+    print("Optimized Tilt:", result.x[0])
+    print("Optimized Azimuth:", result.x[1])
+    print("Optimized Energy:", -result.fun)  # Minimize -energy to maximize energy
+
+
+
+    bnds = ((0,90),(0,360))
+    initial_guess = [45,180]  # initial guess can be anything
+    result = spo.minimize(objFNetEnergy, initial_guess,args
+                            ,bounds = bnds
+                          )
+    print(f"For a {args[0]} array over {season}:\n Total self consumption of {abs(result.fun)} from Optimal tilt = {result.x[0]}, Optimal azimuth = {result.x[1]}")
\ No newline at end of file
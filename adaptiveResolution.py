@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed May  8 10:18:44 2024
+
+@author: miran
+
+Adaptive time resolution for simulations on fine (e.g. 1-minute) weather.
+
+The model is first evaluated on a coarse step (hourly by default). Each coarse
+interval is then halved and the trapezium estimates before and after are compared
+(Richardson estimate, error ~ difference/3). Intervals whose error is too large
+for their share of the tolerance are halved again, so only sunrise/sunset and
+quickly changing (cloudy) periods end up simulated at the full resolution.
+Coarse intervals where the irradiance itself is well represented by the coarse
+step are accepted straight away, without simulating their midpoints.
+"""
+
+import numpy as np
+import pandas as pd
+from pvlib.modelchain import ModelChain
+
+from my_functions import CaseStudyMPVChain, bifacialIrradiance
+from solarGeometry import CachedLocation
+from sweepEngine import sweepInputs, evaluateOrientations
+
+
+def adaptiveIntegrate(evaluate,n,coarseStep,tolerance=0.005,dx=1.,indicator=None):
+    '''
+    Trapezium integral over n equally spaced samples, only evaluating the samples needed.
+
+    evaluate(positions) returns the integrand at an array of sample positions.
+    Refinement stops once the estimated error of every interval is below
+    tolerance (relative to the total) times the interval's share of the samples.
+    indicator is an optional quantity known at every sample (e.g. ghi) that the
+    integrand roughly follows: coarse intervals where its own trapezium error is
+    small enough are accepted without simulating any extra samples.
+    Returns the integral, the estimated absolute error and the evaluated values
+    by position (dict).
+    '''
+    if n < 2:
+        # No interval to integrate over, the trapezium integral of one sample is 0
+        positions = np.arange(n)
+        return 0.,0.,dict(zip(positions,evaluate(positions))) if n else {}
+    coarseStep = max(1,int(coarseStep))
+    nodes = np.unique(np.append(np.arange(0,n,coarseStep),n-1))
+    values = dict(zip(nodes,evaluate(nodes)))
+
+    def trapezium(a,b):
+        return (values[a]+values[b])/2*(b-a)*dx
+
+    # Coarse estimate used to set the absolute tolerance
+    intervals = [(a,b) for a,b in zip(nodes[:-1],nodes[1:])]
+    estimate = sum(trapezium(a,b) for a,b in intervals)
+    budget = tolerance*abs(estimate)/(n-1)
+
+    total = 0.
+    error = 0.
+    if indicator is not None:
+        # Error the coarse step would make on the indicator, scaled to the integrand
+        indicator = np.nan_to_num(np.asarray(indicator,dtype=float))
+        cumulative = np.concatenate([[0.],np.cumsum((indicator[1:]+indicator[:-1])/2)])
+        a,b = nodes[:-1],nodes[1:]
+        proxyError = np.abs((indicator[a]+indicator[b])/2*(b-a)-(cumulative[b]-cumulative[a]))
+        proxyTotal = (indicator[a]+indicator[b]).sum()/2*coarseStep
+        scale = abs(estimate)/(proxyTotal*dx) if proxyTotal > 0 else 0.
+        proxyError = proxyError*scale*dx
+        accept = proxyError <= budget*(b-a)
+        for i in np.flatnonzero(accept):
+            total += trapezium(a[i],b[i])
+            error += proxyError[i]
+        intervals = [(a[i],b[i]) for i in np.flatnonzero(~accept)]
+
+    while intervals:
+        # Exact intervals can't be refined
+        exact = [(a,b) for a,b in intervals if b-a == 1]
+        total += sum(trapezium(a,b) for a,b in exact)
+        intervals = [(a,b) for a,b in intervals if b-a > 1]
+        if not intervals:
+            break
+
+        # Evaluate every midpoint of this round in one call
+        mids = np.array([(a+b)//2 for a,b in intervals])
+        new = mids[[m not in values for m in mids]]
+        if len(new):
+            values.update(zip(new,evaluate(new)))
+
+        refine = []
+        for (a,b),m in zip(intervals,mids):
+            coarse = trapezium(a,b)
+            fine = trapezium(a,m)+trapezium(m,b)
+            intervalError = abs(fine-coarse)/3
+            if intervalError <= budget*(b-a):
+                total += fine
+                error += intervalError
+            else:
+                refine.extend([(a,m),(m,b)])
+        intervals = refine
+    return total,error,values
+
+
+def RunSimAdaptive(tilt,azimuth,faciality,weatherData,site,sandiaModules=None,cecModules=None,cecInverters=None,
+                   bifaciality=0.95,tolerance=0.005,coarseStep=None):
+    '''
+    RunSim's energy (Wh, integrated the same way) at the coarsest resolution
+    meeting tolerance (relative energy error). coarseStep is in samples, by default
+    one hour of the weather's time step.
+
+    Returns a dict with energy, error (estimated absolute), relativeError,
+    evaluations (timesteps simulated), speedup (timesteps in the weather per
+    timestep simulated) and p_mp/ac series at the simulated timesteps.
+    '''
+    times = weatherData.index
+    n = len(times)
+    step = (times[1]-times[0]) if n > 1 else pd.Timedelta(hours=1)
+    if coarseStep is None:
+        coarseStep = max(1,int(round(pd.Timedelta(hours=1)/step)))
+
+    system,irrad = CaseStudyMPVChain(weatherData,faciality,tilt,azimuth,sandiaModules,cecModules,cecInverters,
+                                     bifaciality,irradiance=False)
+    acValues = {}
+
+    if faciality == 'Monofacial':
+        def evaluate(positions):
+            results = evaluateOrientations([tilt],[azimuth],sweepInputs(weatherData.iloc[positions],site),
+                                           system,('p_mp','ac'))
+            acValues.update(zip(positions,results['ac'][0]))
+            return results['p_mp'][0]
+    else:
+        modelchain = ModelChain(system,CachedLocation(site),aoi_model='no_loss',spectral_model="no_loss")
+        def evaluate(positions):
+            subset = weatherData.iloc[positions]
+            if faciality == 'Bifacial':
+                modelchain.run_model_from_effective_irradiance(bifacialIrradiance(subset,tilt,azimuth,bifaciality))
+            else:
+                modelchain.run_model(subset)
+            acValues.update(zip(positions,modelchain.results.ac.to_numpy()))
+            return modelchain.results.dc['p_mp'].fillna(0).to_numpy()
+
+    # Irradiance is known at every timestep, so it shows where the power changes quickly
+    indicator = weatherData['ghi'].to_numpy() if 'ghi' in weatherData else None
+    energy,error,values = adaptiveIntegrate(evaluate,n,coarseStep,tolerance,step/pd.Timedelta(hours=1),indicator)
+    positions = np.array(sorted(values))
+    index = times[positions]
+    return dict(energy=energy,
+                error=error,
+                relativeError=error/abs(energy) if energy else 0.,
+                evaluations=len(positions),
+                speedup=n/len(positions),
+                p_mp=pd.Series([values[p] for p in positions],index=index),
+                ac=pd.Series([acValues[p] for p in positions],index=index))
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat May 11 11:32:40 2024
+
+@author: miran
+
+Offline benchmarks of the simulation hot paths.
+
+Everything runs on synthetic weather and the frozen catalog (offlineFixtures),
+so no PVGIS or GitHub access is needed. Each benchmark reports evaluations per
+second (best of several repeats) and peak Python memory (tracemalloc, measured
+in a separate run so it doesn't slow the timing), and is compared against a
+stored baseline:
+
+    python benchmarks.py                  run all and compare to the baseline
+    python benchmarks.py --save           also store the results as the new baseline
+    python benchmarks.py --only RunSim    only benchmarks whose name contains RunSim
+
+A full run also times importing the simulation modules in a new interpreter,
+against the fixed IMPORT_BUDGET rather than the baseline.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from RunSim import RunSim
+from my_functions import CaseStudyMPVChain, generateWeather
+from sweepEngine import RunSweep, gridOrientations
+from energyMetrics import energyBalance, selfConsumption
+from simulationContext import SimulationContext
+from orientationOptimiser import surrogateOptimise
+from offlineFixtures import CASE_STUDY_SITE, frozenCatalogs, fixtureWeather
+import bifacialCache
+import solarGeometry
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),'benchmarkBaseline.json')
+# Relative slowdown (or memory growth) reported as a regression
+TOLERANCE = 0.2
+# Modules scripts and sweep workers start with, and the seconds they may add to importing pvlib
+STARTUP_MODULES = ['RunSim','sweepRunner','simulationContext','multiSiteRunner',
+                   'orientationOptimiser','energyAggregation','my_functions']
+IMPORT_BUDGET = 0.15
+
+
+def _setup():
+    sandiaModules,cecModules,cecInverters = frozenCatalogs()
+    weatherData = fixtureWeather()
+    consumption = np.full(len(weatherData),300.)
+    return dict(site=CASE_STUDY_SITE,weatherData=weatherData,consumption=consumption,
+                catalogs=(sandiaModules,cecModules,cecInverters))
+
+def _coldCaches():
+    # Benchmarks measure the work, not the caches left by the previous repeat
+    solarGeometry.clearCache()
+    bifacialCache.defaultCache().clear()
+
+def benchRunSim(faciality):
+    def run(f):
+        _coldCaches()
+        RunSim(35,185,faciality,f['weatherData'],f['site'],*f['catalogs'])
+        return 1
+    return run
+
+def benchGenerateWeather(f):
+    _coldCaches()
+    times = f['weatherData'].index
+    generateWeather('synthetic',f['site'],times,times.year[0])
+    return 1
+
+def benchModelChain(f):
+    for azimuth in range(0,360,10):
+        CaseStudyMPVChain(f['weatherData'],'Monofacial',35,azimuth,*f['catalogs'],irradiance=False)
+    return 36
+
+def benchSweep(f):
+    _coldCaches()
+    tilts,azimuths = gridOrientations(np.arange(0,91,15),np.arange(90,271,30))
+    RunSweep(tilts,azimuths,f['weatherData'],f['site'],*f['catalogs'],outputs=())
+    return len(tilts)
+
+def benchSelfConsumption(f):
+    ac = np.random.default_rng(0).random((50,len(f['weatherData'])))*1500
+    for i in range(len(ac)):
+        selfConsumption(ac[i],f['consumption'])
+    energyBalance(ac,f['consumption'])
+    return 2*len(ac)
+
+def _objective(x,context):
+    return -context.evaluate(x[0],x[1])[0]
+
+def benchOptimiser(f):
+    _coldCaches()
+    context = SimulationContext('Monofacial',f['weatherData'],f['site'],*f['catalogs'])
+    surrogateOptimise(_objective,((0,90),(0,360)),args=(context,),nInitial=12,nRefine=6,seed=0)
+    return context.evaluations
+
+BENCHMARKS = {
+    'RunSim Monofacial':benchRunSim('Monofacial'),
+    'RunSim Bifacial':benchRunSim('Bifacial'),
+    'RunSim Case-Study':benchRunSim('Case-Study'),
+    'generateWeather synthetic':benchGenerateWeather,
+    'CaseStudyMPVChain':benchModelChain,
+    'RunSweep 7x7 grid':benchSweep,
+    'selfConsumption':benchSelfConsumption,
+    'surrogateOptimise':benchOptimiser,
+    }
+
+
+def measure(bench,fixtures,repeats=3):
+    '''
+    Evaluations per second (best repeat) and peak traced memory in MB
+    '''
+    best = np.inf
+    for i in range(repeats):
+        start = time.perf_counter()
+        evaluations = bench(fixtures)
+        best = min(best,time.perf_counter()-start)
+    tracemalloc.start()
+    try:
+        bench(fixtures)
+        current,peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return dict(evaluationsPerSecond=evaluations/best,seconds=best,evaluations=evaluations,peakMB=peak/1e6)
+
+def importInFreshProcess(modules=STARTUP_MODULES,watch=()):
+    '''
+    Seconds importing modules adds to importing pvlib in a new interpreter, and
+    which of the watch modules that loaded
+    '''
+    code = ("import json, sys, time; import pvlib; start = time.perf_counter(); "
+            f"import {', '.join(modules)}; seconds = time.perf_counter()-start; "
+            f"print(json.dumps(dict(seconds=seconds, loaded=[m for m in {list(watch)!r} if m in sys.modules])))")
+    output = subprocess.run([sys.executable,'-c',code],capture_output=True,text=True,check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return json.loads(output.splitlines()[-1])
+
+def importSeconds(modules=STARTUP_MODULES,repeats=3):
+    '''
+    Best of repeats of importInFreshProcess
+    '''
+    return min(importInFreshProcess(modules)['seconds'] for i in range(repeats))
+
+def runBenchmarks(names=None,repeats=3):
+    fixtures = _setup()
+    results = {}
+    for name,bench in BENCHMARKS.items():
+        if names is None or any(n in name for n in names):
+            results[name] = measure(bench,fixtures,repeats)
+    return results
+
+def compareBaseline(results,baseline,tolerance=TOLERANCE):
+    '''
+    DataFrame of each result against the baseline, flagging slowdowns and memory
+    growth beyond tolerance
+    '''
+    rows = {}
+    for name,result in results.items():
+        row = dict(result)
+        if name in baseline:
+            row['speedRatio'] = result['evaluationsPerSecond']/baseline[name]['evaluationsPerSecond']
+            row['memoryRatio'] = result['peakMB']/max(baseline[name]['peakMB'],1e-9)
+            row['regression'] = bool(row['speedRatio'] < 1-tolerance or row['memoryRatio'] > 1+tolerance)
+        rows[name] = row
+    return pd.DataFrame(rows).T
+
+def loadBaseline(path=None):
+    path = BASELINE_PATH if path is None else path
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)['results']
+
+def saveBaseline(results,path=None):
+    path = BASELINE_PATH if path is None else path
+    tmp = path+'.tmp'
+    with open(tmp,'w') as f:
+        json.dump(dict(created=pd.Timestamp.now().isoformat(),results=results),f,indent=1)
+    os.replace(tmp,path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmarks of the simulation hot paths')
+    parser.add_argument('--only',nargs='*',help='only run benchmarks whose name contains one of these')
+    parser.add_argument('--repeats',type=int,default=3)
+    parser.add_argument('--baseline',default=BASELINE_PATH)
+    parser.add_argument('--save',action='store_true',help='store the results as the new baseline')
+    options = parser.parse_args()
+
+    results = runBenchmarks(options.only,options.repeats)
+    baseline = loadBaseline(options.baseline)
+    with pd.option_context('display.width',160,'display.max_columns',10):
+        print(compareBaseline(results,baseline))
+    if not baseline:
+        print(f"No baseline at {options.baseline}, run with --save to store one")
+    slowImports = False
+    if options.only is None:
+        seconds = importSeconds(repeats=options.repeats)
+        slowImports = seconds > IMPORT_BUDGET
+        print(f"Importing the simulation modules adds {seconds:.3f} s to pvlib (budget {IMPORT_BUDGET} s)")
+    if options.save:
+        saveBaseline({**baseline,**results},options.baseline)
+    elif any(compareBaseline(results,baseline).get('regression',pd.Series(dtype=bool)).fillna(False)):
+        raise SystemExit("Performance regression against the baseline")
+    if slowImports:
+        raise SystemExit("Importing the simulation modules is over the budget")
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri May  3 11:04:26 2024
+
+@author: miran
+
+In-memory cache of pvfactors bifacial irradiance.
+
+pvfactors is by far the slowest step of a bifacial simulation and only depends
+on the orientation, the row geometry, the albedo and the weather, so results are
+kept keyed by those. Bifaciality is applied afterwards, so it isn't part of the key.
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_MAX_MB = float(os.environ.get('BIFACIAL_CACHE_MAX_MB',256))
+
+# Columns returned by pvfactors_timeseries
+IRRADIANCE_COLUMNS = ['total_inc_front','total_inc_back','total_abs_front','total_abs_back']
+
+# Weather columns pvfactors reads
+WEATHER_COLUMNS = ['azimuth','apparent_zenith','dni','dhi']
+
+
+def weatherHash(poaData):
+    '''
+    Hash of the time index and the weather values pvfactors uses
+    '''
+    digest = hashlib.sha1(poaData.index.asi8.tobytes())
+    digest.update(str(poaData.index.tz).encode('utf-8'))
+    for column in WEATHER_COLUMNS:
+        digest.update(np.ascontiguousarray(poaData[column].to_numpy(dtype=float)).tobytes())
+    return digest.hexdigest()
+
+
+class BifacialCache:
+    '''
+    LRU cache of pvfactors results, limited to maxBytes of irradiance arrays
+    '''
+    def __init__(self,maxBytes=None):
+        self.maxBytes = CACHE_MAX_MB*1e6 if maxBytes is None else maxBytes
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self,poaData,tilt,azimuth,gcr,albedo,pvrowHeight,pvrowWidth):
+        # Hashing the weather is cheap next to a pvfactors run
+        return (round(float(tilt),6),round(float(azimuth),6),float(gcr),float(albedo),
+                float(pvrowHeight),float(pvrowWidth),weatherHash(poaData))
+
+    def fetch(self,key,compute):
+        '''
+        Return the cached (column, time) array for key, calling compute() on a miss
+        '''
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        values = np.ascontiguousarray(compute(),dtype=float)
+        values.setflags(write=False)
+        self.entries[key] = values
+        self.evict()
+        return values
+
+    def size(self):
+        return sum(v.nbytes for v in self.entries.values())
+
+    def evict(self):
+        # Always keep the newest entry
+        while len(self.entries) > 1 and self.size() > self.maxBytes:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+_default = None
+
+def defaultCache():
+    global _default
+    if _default is None:
+        _default = BifacialCache()
+    return _default
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri May  3 15:48:09 2024
+
+@author: miran
+
+Interpolating surrogate for the pvfactors bifacial irradiance.
+
+pvfactors is run once at each node of a tilt x azimuth grid (through the
+bifacial cache) and the absorbed front/back irradiance at other orientations is
+interpolated bilinearly between the four surrounding nodes. errorBound() checks
+the interpolation against pvfactors at cell midpoints, where it is least accurate.
+Memory is (tilts x azimuths x 2 x timesteps) floats, so use a coarse grid with
+1-minute weather.
+"""
+
+import numpy as np
+import pandas as pd
+
+from my_functions import bifacialIrradiance
+
+
+class BifacialSurrogate:
+    '''
+    Bilinear interpolation of pvfactors irradiance over a tilt x azimuth grid
+    '''
+    def __init__(self,poaData,tiltOpts,aziOpts,gcr=0.1,albedo=0.3,pvrowHeight=1,pvrowWidth=1,cache=None):
+        self.poaData = poaData
+        self.tiltOpts = np.unique(np.asarray(tiltOpts,dtype=float))
+        self.aziOpts = np.unique(np.asarray(aziOpts,dtype=float))
+        if len(self.tiltOpts) < 2 or len(self.aziOpts) < 2:
+            raise ValueError("The surrogate grid needs at least two tilts and two azimuths")
+        self.geometry = dict(gcr=gcr,albedo=albedo,pvrowHeight=pvrowHeight,pvrowWidth=pvrowWidth,cache=cache)
+        self.error = None
+
+        self.nodes = np.empty((len(self.tiltOpts),len(self.aziOpts),2,len(poaData)))
+        for i,tilt in enumerate(self.tiltOpts):
+            for j,azimuth in enumerate(self.aziOpts):
+                irrad = bifacialIrradiance(poaData,tilt,azimuth,**self.geometry)
+                self.nodes[i,j,0] = irrad['total_abs_front'].to_numpy()
+                self.nodes[i,j,1] = irrad['total_abs_back'].to_numpy()
+        # pvfactors gives NaN at night, interpolate zero instead
+        self.nodes = np.nan_to_num(self.nodes)
+
+    @staticmethod
+    def _locate(value,grid):
+        i = int(np.clip(np.searchsorted(grid,value,side='right')-1,0,len(grid)-2))
+        fraction = float(np.clip((value-grid[i])/(grid[i+1]-grid[i]),0,1))
+        return i,fraction
+
+    def absorbed(self,tilt,azimuth):
+        '''
+        Interpolated (front, back) absorbed irradiance, shape (2, time)
+        '''
+        i,ft = self._locate(tilt,self.tiltOpts)
+        j,fa = self._locate(azimuth,self.aziOpts)
+        n = self.nodes
+        return ((1-ft)*(1-fa)*n[i,j] + ft*(1-fa)*n[i+1,j]
+                + (1-ft)*fa*n[i,j+1] + ft*fa*n[i+1,j+1])
+
+    def irradiance(self,tilt,azimuth,bifaciality=0.95):
+        '''
+        Same columns as bifacialIrradiance needed by run_model_from_effective_irradiance
+        '''
+        front,back = self.absorbed(tilt,azimuth)
+        irrad = pd.DataFrame({'total_abs_front':front,'total_abs_back':back},index=self.poaData.index)
+        irrad['effective_irradiance'] = irrad['total_abs_front'] + irrad['total_abs_back']*bifaciality
+        return irrad
+
+    def errorBound(self,samples=8,bifaciality=0.95,seed=0):
+        '''
+        Compare against pvfactors at the midpoints of samples random grid cells
+        (every cell if samples is None). Stores and returns the largest relative
+        error in integrated effective irradiance and the largest absolute error
+        at any timestep (W/m2).
+        '''
+        cells = [(i,j) for i in range(len(self.tiltOpts)-1) for j in range(len(self.aziOpts)-1)]
+        if samples is not None and samples < len(cells):
+            rng = np.random.default_rng(seed)
+            cells = [cells[k] for k in rng.choice(len(cells),samples,replace=False)]
+
+        relative = 0.
+        absolute = 0.
+        for i,j in cells:
+            tilt = (self.tiltOpts[i]+self.tiltOpts[i+1])/2
+            azimuth = (self.aziOpts[j]+self.aziOpts[j+1])/2
+            exact = bifacialIrradiance(self.poaData,tilt,azimuth,bifaciality,**self.geometry)
+            exact = np.nan_to_num(exact['effective_irradiance'].to_numpy())
+            approx = self.irradiance(tilt,azimuth,bifaciality)['effective_irradiance'].to_numpy()
+            relative = max(relative,abs(approx.sum()-exact.sum())/max(exact.sum(),1e-12))
+            absolute = max(absolute,np.abs(approx-exact).max())
+        self.error = dict(relativeEnergy=relative,maxAbsolute=absolute,cells=len(cells))
+        return self.error
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue May  7 14:02:51 2024
+
+@author: miran
+
+Columnar store for the case study Victron GX (Multiplus) logs.
+
+Each CSV export is streamed in chunks: the three row header (device, channel,
+unit) is parsed once, every column gets a fixed dtype (float64 unless it holds
+text such as the charge state anywhere in the export, found in a first pass that
+only checks the values parse), timestamps are parsed in one vectorised call per
+chunk, and the chunks are appended to parquet files partitioned by year and month.
+A manifest records which exports have been ingested, so a new two-monthly log is
+the only file read on the next load. Loads only read the requested columns and
+the partitions overlapping the requested time range.
+
+CaseStudyDataset is the cleaned view used for plots and validation: duplicates
+removed once, and hourly/daily means of every channel computed once and stored
+alongside the partitions.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Where the raw exports are, and where the parquet store is kept
+SOURCE_DIR = os.environ.get('CASE_STUDY_DIR',r"G:\My Drive\Uni stuff\WOrk\Notability (Y1-3)\Y4S2\FYP\Modelling\Andrews panels")
+STORE_DIR = os.environ.get('CASE_STUDY_STORE',os.path.join(os.path.expanduser('~'),'.cache','casestudy'))
+
+CHUNK_ROWS = 200_000
+TIME_COLUMN = 'timestamp'
+
+
+def readVictronHeader(path):
+    '''
+    Combine the three header rows into 'device_channel_unit' column names
+    '''
+    header = pd.read_csv(path,index_col=0,nrows=3,header=None,dtype=str)
+    header = header.fillna('')
+    return list(header.iloc[0]+'_'+header.iloc[1]+'_'+header.iloc[2])
+
+def columnTypes(chunk):
+    '''
+    float64 for columns where every value parses as a number, string otherwise
+    '''
+    types = {}
+    for col in chunk.columns:
+        values = chunk[col]
+        numeric = pd.to_numeric(values,errors='coerce')
+        types[col] = pa.float64() if numeric.notna().sum() == values.notna().sum() else pa.string()
+    return types
+
+def _readChunks(path,names,chunkRows):
+    # Raw text chunks of the rows after the header
+    return pd.read_csv(path,skiprows=3,header=None,names=[TIME_COLUMN]+names,
+                       dtype=str,chunksize=chunkRows)
+
+def scanColumnTypes(path,names=None,chunkRows=None):
+    '''
+    columnTypes over the whole export, read chunk by chunk: a column is string if
+    any chunk has text in it, so the types don't depend on what the first rows hold
+    '''
+    if chunkRows is None:
+        chunkRows = CHUNK_ROWS
+    if names is None:
+        names = readVictronHeader(path)
+    types = {col:pa.float64() for col in names}
+    for chunk in _readChunks(path,names,chunkRows):
+        # Rows without a timestamp are dropped when the export is streamed
+        chunk = chunk[chunk.pop(TIME_COLUMN).notna()]
+        numeric = [col for col in names if pa.types.is_floating(types[col])]
+        for col,dtype in columnTypes(chunk[numeric]).items():
+            types[col] = dtype
+    return types
+
+def _typed(chunk,schema):
+    columns = {}
+    for field in schema:
+        if field.name == TIME_COLUMN:
+            continue
+        values = chunk[field.name] if field.name in chunk else pd.Series(None,index=chunk.index,dtype=object)
+        if pa.types.is_floating(field.type):
+            columns[field.name] = pd.to_numeric(values,errors='coerce').astype(float)
+        else:
+            columns[field.name] = values.where(values.notna(),None).astype(object)
+    data = pd.DataFrame(columns,index=chunk.index)
+    data.insert(0,TIME_COLUMN,chunk.index)
+    return pa.Table.from_pandas(data,schema=schema,preserve_index=False)
+
+def streamVictronLog(path,chunkRows=None):
+    '''
+    Yield arrow table chunks of a Victron export with fixed column types
+    '''
+    if chunkRows is None:
+        chunkRows = CHUNK_ROWS
+    names = readVictronHeader(path)
+    types = scanColumnTypes(path,names,chunkRows)
+    schema = pa.schema([(TIME_COLUMN,pa.timestamp('ns'))]+[(c,types[c]) for c in names])
+    for chunk in _readChunks(path,names,chunkRows):
+        # One vectorised parse per chunk, the format is inferred from the first row
+        chunk.index = pd.to_datetime(chunk.pop(TIME_COLUMN))
+        chunk = chunk[chunk.index.notna()]
+        yield _typed(chunk,schema)
+
+
+class CaseStudyStore:
+    '''
+    Partitioned parquet store (year=YYYY/month=MM) of ingested Victron exports
+    '''
+    def __init__(self,storeDir=None):
+        self.storeDir = STORE_DIR if storeDir is None else storeDir
+        self.manifestPath = os.path.join(self.storeDir,'manifest.json')
+
+    def manifest(self):
+        if not os.path.exists(self.manifestPath):
+            return {}
+        with open(self.manifestPath) as f:
+            return json.load(f)
+
+    def _saveManifest(self,manifest):
+        tmp = self.manifestPath+'.'+uuid.uuid4().hex+'.tmp'
+        with open(tmp,'w') as f:
+            json.dump(manifest,f,indent=1,sort_keys=True)
+        os.replace(tmp,self.manifestPath)
+
+    def ingest(self,path,chunkRows=None):
+        '''
+        Append one export to the store, returns the number of rows (0 if already ingested)
+        '''
+        name = os.path.splitext(os.path.basename(path))[0]
+        stat = os.stat(path)
+        manifest = self.manifest()
+        entry = manifest.get(name)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return 0
+        if entry is not None:
+            self._remove(entry)
+
+        os.makedirs(self.storeDir,exist_ok=True)
+        tag = '.'+uuid.uuid4().hex+'.tmp'
+        writers = {}
+        rows = 0
+        try:
+            for table in streamVictronLog(path,chunkRows):
+                times = table.column(TIME_COLUMN).to_numpy()
+                months = pd.DatetimeIndex(times).to_period('M').asi8
+                for month in np.unique(months):
+                    part = table.filter(pa.array(months == month))
+                    if month not in writers:
+                        period = pd.Period(ordinal=month,freq='M')
+                        partDir = os.path.join(self.storeDir,f'year={period.year}',f'month={period.month:02d}')
+                        os.makedirs(partDir,exist_ok=True)
+                        partPath = os.path.join(partDir,name+'.parquet')
+                        writers[month] = (partPath,pq.ParquetWriter(partPath+tag,table.schema,compression='zstd'))
+                    writers[month][1].write_table(part)
+                rows += table.num_rows
+        finally:
+            for partPath,writer in writers.values():
+                writer.close()
+        # Only publish the partitions once the whole export has been read
+        parts = []
+        for partPath,writer in writers.values():
+            os.replace(partPath+tag,partPath)
+            parts.append(os.path.relpath(partPath,self.storeDir))
+        manifest[name] = dict(size=stat.st_size,mtime=stat.st_mtime,rows=rows,parts=sorted(parts))
+        self._saveManifest(manifest)
+        return rows
+
+    def _remove(self,entry):
+        for part in entry['parts']:
+            path = os.path.join(self.storeDir,part)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def files(self,start=None,end=None):
+        '''
+        Partition files, only those for months overlapping start to end
+        '''
+        first = None if start is None else pd.Period(pd.Timestamp(start),freq='M')
+        last = None if end is None else pd.Period(pd.Timestamp(end),freq='M')
+        files = []
+        for entry in self.manifest().values():
+            for part in entry['parts']:
+                year,month = [int(p.split('=')[1]) for p in os.path.normpath(part).split(os.sep)[:2]]
+                period = pd.Period(year=year,month=month,freq='M')
+                if (first is None or period >= first) and (last is None or period <= last):
+                    files.append(os.path.join(self.storeDir,part))
+        return sorted(files)
+
+    def load(self,columns=None,start=None,end=None):
+        '''
+        DataFrame indexed by timestamp with only the requested columns and time range
+        (start/end inclusive, as with .loc)
+        '''
+        if not self.manifest():
+            raise FileNotFoundError(f"No case study data has been ingested into {self.storeDir}")
+        # Exports can have different devices, so use the columns of all of them
+        schema = pa.unify_schemas([pq.read_schema(f) for f in self.files()])
+        files = self.files(start,end)
+        dataset = ds.dataset(files,schema=schema,format='parquet')
+
+        time = ds.field(TIME_COLUMN)
+        condition = None
+        if start is not None:
+            condition = time >= pa.scalar(pd.Timestamp(start).as_unit('ns').to_datetime64(),type=pa.timestamp('ns'))
+        if end is not None:
+            endTime = pd.Timestamp(end)
+            # A date on its own includes the whole day, like .loc
+            if isinstance(end,str) and len(end) <= 10:
+                endTime = endTime+pd.Timedelta(days=1)-pd.Timedelta(1,'ns')
+            upper = time <= pa.scalar(endTime.as_unit('ns').to_datetime64(),type=pa.timestamp('ns'))
+            condition = upper if condition is None else condition & upper
+
+        if columns is not None:
+            columns = [TIME_COLUMN]+[c for c in columns if c != TIME_COLUMN]
+        table = dataset.to_table(columns=columns,filter=condition)
+        data = table.to_pandas()
+        data = data.set_index(TIME_COLUMN)
+        data.index.name = None
+        # Files are ingested in any order, keep the rows in time order (stable for duplicates)
+        return data.sort_index(kind='mergesort')
+
+    def signature(self):
+        '''
+        Changes whenever an export is added or re-ingested
+        '''
+        text = json.dumps(self.manifest(),sort_keys=True)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def aggregate(self,freq,data=None):
+        '''
+        Mean of every numeric channel per freq period ('H', 'D'), computed from the
+        cleaned data once and kept in the store until the next ingest
+        '''
+        path = os.path.join(self.storeDir,'aggregates',freq+'.parquet')
+        signature = self.signature()
+        if os.path.exists(path):
+            metadata = pq.read_schema(path).metadata or {}
+            if metadata.get(b'signature') == signature.encode('utf-8'):
+                return pd.read_parquet(path)
+
+        if data is None:
+            data = cleanCaseStudyData(self.load())
+        aggregate = data.select_dtypes('number').resample(freq).mean()
+        table = pa.Table.from_pandas(aggregate)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),b'signature':signature.encode('utf-8')})
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        tmp = path+'.'+uuid.uuid4().hex+'.tmp'
+        pq.write_table(table,tmp,compression='zstd')
+        os.replace(tmp,path)
+        return aggregate
+
+
+def ingestCaseStudyLogs(sourceDir=None,storeDir=None,fileNames=None):
+    '''
+    Ingest every Victron export in sourceDir not already in the store
+    '''
+    if sourceDir is None:
+        sourceDir = SOURCE_DIR
+    store = CaseStudyStore(storeDir)
+    if fileNames is None:
+        fileNames = sorted(f for f in os.listdir(sourceDir) if f.endswith('.csv') and 'Multiplus' in f)
+    added = {}
+    for fileName in fileNames:
+        if not fileName.endswith('.csv'):
+            fileName += '.csv'
+        rows = store.ingest(os.path.join(sourceDir,fileName))
+        if rows:
+            added[fileName] = rows
+    return store,added
+
+
+def cleanCaseStudyData(data):
+    '''
+    Drop repeated timestamps (keeping the first, where exports overlap) and make
+    sure every channel that should be numeric is
+    '''
+    data = data[~data.index.duplicated(keep='first')]
+    converted = {}
+    for col in data.columns[data.dtypes == object]:
+        numeric = pd.to_numeric(data[col],errors='coerce')
+        # Text channels (e.g. charge state) are kept as they are
+        if numeric.notna().sum() == data[col].notna().sum():
+            converted[col] = numeric
+    if converted:
+        data = data.assign(**converted)
+    return data
+
+
+class CaseStudyDataset:
+    '''
+    Cleaned case study data with cached hourly and daily channel means.
+
+    Built either from a store (aggregates are persisted there) or from an already
+    loaded DataFrame (aggregates are only cached in memory).
+    '''
+    def __init__(self,store=None,data=None):
+        if store is None and data is None:
+            store = CaseStudyStore()
+        self.store = store
+        self._data = None if data is None else cleanCaseStudyData(data)
+        self._aggregates = {}
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = cleanCaseStudyData(self.store.load())
+        return self._data
+
+    def aggregate(self,freq):
+        if freq not in self._aggregates:
+            if self.store is not None:
+                self._aggregates[freq] = self.store.aggregate(freq,self._data)
+            else:
+                self._aggregates[freq] = self.data.select_dtypes('number').resample(freq).mean()
+        return self._aggregates[freq]
+
+    @property
+    def hourly(self):
+        return self.aggregate('H')
+
+    @property
+    def daily(self):
+        return self.aggregate('D')
+
+    def channel(self,col,numeric=False):
+        '''
+        One channel at full resolution without missing samples
+        '''
+        values = self.data[col]
+        if numeric:
+            values = pd.to_numeric(values,errors='coerce')
+        return values.dropna()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Apr 27 14:05:52 2024
+
+@author: miran
+
+Local catalog of module and inverter parameters.
+
+The SAM databases are parsed once with retrieve_sam and snapshotted to a binary
+file of pickled records plus a name index. Afterwards single records are read on
+demand through a memory map, so every process shares the same pages from the OS
+file cache instead of each holding its own copy of the full tables.
+"""
+
+import json
+import mmap
+import os
+import pickle
+import uuid
+
+import pandas as pd
+import pvlib
+
+CEC_MODULES_URL = 'https://raw.githubusercontent.com/NREL/SAM/patch/deploy/libraries/CEC%20Modules.csv'
+
+# Where each database is snapshotted from (keyword arguments for retrieve_sam)
+SOURCES = {
+    'SandiaMod': dict(name='SandiaMod'),
+    'CECModules': dict(path=CEC_MODULES_URL),
+    'CECInverter': dict(name='CECInverter'),
+    }
+
+CATALOG_DIR = os.environ.get('PV_CATALOG_DIR',os.path.join(os.path.expanduser('~'),'.cache','pvcatalog'))
+
+
+class CatalogDatabase:
+    '''
+    Read-only, dict-like view of one snapshotted database.
+
+    database['name'] returns the same pd.Series as retrieve_sam(...)['name'], so it
+    can be passed anywhere the full DataFrame was used for lookups by name.
+    '''
+    def __init__(self,dataPath,indexPath):
+        self.dataPath = dataPath
+        self.indexPath = indexPath
+        with open(indexPath) as f:
+            index = json.load(f)
+        self.fields = index['fields']
+        self.offsets = index['records']
+        self._records = {}
+        self._file = None
+        self._map = None
+
+    def _open(self):
+        if self._map is None:
+            self._file = open(self.dataPath,'rb')
+            self._map = mmap.mmap(self._file.fileno(),0,access=mmap.ACCESS_READ)
+        return self._map
+
+    def __getitem__(self,name):
+        if name not in self._records:
+            try:
+                offset,length = self.offsets[name]
+            except KeyError:
+                raise KeyError(f"{name} not found in {os.path.basename(self.dataPath)}") from None
+            values = pickle.loads(self._open()[offset:offset+length])
+            self._records[name] = pd.Series(values,index=self.fields,name=name,dtype=object)
+        return self._records[name]
+
+    def __contains__(self,name):
+        return name in self.offsets
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def keys(self):
+        return self.offsets.keys()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = None
+            self._file = None
+
+    # Only the paths are sent to worker processes, they reopen the map themselves
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_file'] = None
+        state['_map'] = None
+        state['_records'] = {}
+        return state
+
+
+def _paths(database,catalogDir):
+    return (os.path.join(catalogDir,database+'.bin'),
+            os.path.join(catalogDir,database+'.idx.json'))
+
+def snapshot(database,source=None,catalogDir=None):
+    '''
+    Parse a SAM database with retrieve_sam and write it to the catalog
+    '''
+    if catalogDir is None:
+        catalogDir = CATALOG_DIR
+    if source is None:
+        source = SOURCES[database]
+    table = pvlib.pvsystem.retrieve_sam(**source) if isinstance(source,dict) else source
+
+    os.makedirs(catalogDir,exist_ok=True)
+    dataPath,indexPath = _paths(database,catalogDir)
+    records = {}
+    offset = 0
+    # Write to temporary files first so other processes never see a partial snapshot
+    tag = '.'+uuid.uuid4().hex+'.tmp'
+    with open(dataPath+tag,'wb') as f:
+        for name in table.columns:
+            blob = pickle.dumps(table[name].tolist(),protocol=pickle.HIGHEST_PROTOCOL)
+            f.write(blob)
+            records[name] = [offset,len(blob)]
+            offset += len(blob)
+    with open(indexPath+tag,'w') as f:
+        json.dump({'fields':list(table.index),'records':records},f)
+    os.replace(dataPath+tag,dataPath)
+    os.replace(indexPath+tag,indexPath)
+    return CatalogDatabase(dataPath,indexPath)
+
+_loaded = {}
+
+def loadCatalog(database,catalogDir=None,source=None):
+    '''
+    Open a snapshotted database, creating the snapshot on first use
+    '''
+    if catalogDir is None:
+        catalogDir = CATALOG_DIR
+    key = (database,os.path.abspath(catalogDir))
+    if key not in _loaded:
+        dataPath,indexPath = _paths(database,catalogDir)
+        if os.path.exists(dataPath) and os.path.exists(indexPath):
+            _loaded[key] = CatalogDatabase(dataPath,indexPath)
+        else:
+            _loaded[key] = snapshot(database,source,catalogDir)
+    return _loaded[key]
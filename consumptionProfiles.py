@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon May 13 09:26:51 2024
+
+@author: miran
+
+Household load profiles for any time index.
+
+A profile is a set of hourly templates (W) for each season and day type, shaped
+(season, dayType, 24), or (household, season, dayType, 24) for a batch. The load
+at each timestamp is looked up by array indexing on its month's season, whether
+it's a weekday or the weekend, and its hour, so minute data, leap years and
+multi-year spans need no special handling. A batch gives a (household, time)
+array that energyMetrics evaluates against one generation series in one go.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Average consumption data extracted from the plot in the report (W)
+SEASON_PROFILES = {
+    'winter':[682.8230953,561.0062893,387.4213836,334.591195,
+              364.7798742,374.3,384.0826487,493.081761,
+              679.245283,681.7610063,727.0440252,711.9496855,
+              729.5597484,759.7484277,769.8113208,767.2955975,
+              880.5031447,1091.823899,1122.012579,1081,
+              1041.509434,996.2264151,903.1446541,832.7044025],
+    'average':[460.7151931,308.1419624,265.5532359,240.5010438,
+               263.0480167,245.5114823,270.5636743,375.782881,
+               503.5490605,508.559499,503.5490605,483.5073069,
+               503.5490605,483.5073069,458.4551148,481.0020877,
+               546.1377871,648.8517745,731.5240084,722.7,
+               713.9874739,681.4196242,611.2734864,558.6638831],
+    'summer':[322.9741931,286.7924528,284.2767296,249.0566038,
+              251.572327,236,221.3836478,314.4654088,437.7358491,
+              447.7987421,430.1886792,442.7672956,455.3459119,
+              394.9685535,379.8742138,407.5471698,440.2515723,
+              500.6289308,533.3333333,538.3647799,535.8490566,
+              525.7,515.7232704,454.6504296],
+    }
+# Profile used in each month (January to December)
+MONTH_SEASONS = ('winter','winter','average','average','average','summer',
+                 'summer','summer','average','average','average','winter')
+DAY_TYPES = ('weekday','weekend')
+
+
+def profileTemplates(weekday=None,weekend=None):
+    '''
+    Templates (season, dayType, 24) in the order of SEASON_PROFILES. weekday and
+    weekend are {season: 24 hourly values}, both default to SEASON_PROFILES.
+    '''
+    weekday = SEASON_PROFILES if weekday is None else weekday
+    weekend = weekday if weekend is None else weekend
+    return np.array([[weekday[season],weekend[season]] for season in SEASON_PROFILES],dtype=float)
+
+def householdTemplates(n,templates=None,seed=0,scaleSpread=0.3,shapeSpread=0.1):
+    '''
+    Batch (household, season, dayType, 24) of n reproducible variations of
+    templates: each household's total is scaled by a lognormal factor (scaleSpread)
+    and every hourly value by its own (shapeSpread)
+    '''
+    templates = profileTemplates() if templates is None else np.asarray(templates,dtype=float)
+    rng = np.random.default_rng(seed)
+    scale = rng.lognormal(0,scaleSpread,n)
+    shape = rng.lognormal(0,shapeSpread,(n,)+templates.shape)
+    return templates*shape*scale[:,None,None,None]
+
+def templateCodes(times,monthSeasons=MONTH_SEASONS):
+    '''
+    Position of each timestamp in the flattened (season, dayType, 24) templates
+    '''
+    times = pd.DatetimeIndex(times)
+    seasons = np.array([list(SEASON_PROFILES).index(season) for season in monthSeasons])
+    season = seasons[times.month.to_numpy()-1]
+    dayType = (times.dayofweek.to_numpy() >= 5).astype(np.intp)
+    return (season*len(DAY_TYPES)+dayType)*24+times.hour.to_numpy()
+
+def loadProfile(times,templates=None,monthSeasons=MONTH_SEASONS):
+    '''
+    Load (W) at each of times, (time,) for one set of templates or (household,
+    time) for a batch. Sub-hourly timestamps take their hour's value, and the
+    local hour is used for a timezone aware index.
+    '''
+    templates = profileTemplates() if templates is None else np.asarray(templates,dtype=float)
+    codes = templateCodes(times,monthSeasons)
+    return templates.reshape(templates.shape[:-3]+(-1,))[...,codes]
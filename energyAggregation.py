@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu May  9 11:20:37 2024
+
+@author: miran
+
+Power to energy aggregation for simulation results at any time step.
+
+Each sample gets a trapezium weight in hours (half of the interval either side),
+so power in W integrates to Wh for hourly, 1-minute or irregular data, and the
+weights of any partition of the samples add up to the annual total exactly.
+Totals by month and day-part (and seasons, derived from the months) come from one
+bincount over all quantities; user-defined windows from one cumulative sum, which
+gives the same value as integrating the sliced series. dayPartStatistics does the
+same grouping per day for morning/afternoon means or sums of any series, and
+windowBalance gives the energy balance of every seasonal window from one annual
+simulation.
+"""
+
+import numpy as np
+import pandas as pd
+
+from energyMetrics import selfConsumptionSeries, energyBalance
+
+# Months in each season (meteorological seasons)
+SEASONS = {'Winter':(12,1,2),'Spring':(3,4,5),'Summer':(6,7,8),'Autumn':(9,10,11)}
+DAY_PARTS = ('morning','afternoon')
+# Seasonal windows the driver scripts study (month-day, inclusive)
+SEASON_WINDOWS = {'Winter':('01-01','02-28'),'Summer':('06-01','08-31'),'Year':('01-01','12-31')}
+
+
+def intervalHours(index):
+    '''
+    Length in hours of each interval between consecutive timestamps
+    '''
+    return np.diff(pd.DatetimeIndex(index).asi8)/3.6e12
+
+def timestepHours(index):
+    '''
+    Trapezium weight in hours of each timestamp, so (power*weights).sum() is the
+    same as integrating power over the index with the trapezium rule
+    '''
+    dt = intervalHours(index)
+    hours = np.zeros(len(index))
+    hours[:-1] += dt/2
+    hours[1:] += dt/2
+    return hours
+
+def integrateEnergy(power,index=None):
+    '''
+    Energy (Wh) of power (W) over the last axis. index defaults to power's own
+    (for a Series/DataFrame), otherwise the samples are taken as hourly.
+    '''
+    if index is None:
+        index = getattr(power,'index',None)
+    values = np.asarray(power,dtype=float)
+    if index is None:
+        return np.trapz(values,axis=-1)
+    return values@timestepHours(index)
+
+def solarTimeHours(index,longitude):
+    '''
+    Apparent solar time of each timestamp in hours (12 is solar noon)
+    '''
+    index = pd.DatetimeIndex(index)
+    utc = index.tz_convert('UTC') if index.tz is not None else index
+    hours = (utc.asi8/3.6e12) % 24
+    # Equation of time (Spencer, 1971), minutes
+    day = 2*np.pi*(index.dayofyear.to_numpy()-1)/365
+    eot = 229.18*(0.000075+0.001868*np.cos(day)-0.032077*np.sin(day)
+                  -0.014615*np.cos(2*day)-0.04089*np.sin(2*day))
+    return (hours+longitude/15+eot/60) % 24
+
+def dayPartCodes(index,longitude=None):
+    '''
+    0 before (solar) noon, 1 after. Without a longitude the clock hour is used.
+    '''
+    if longitude is None:
+        index = pd.DatetimeIndex(index)
+        hours = index.hour+index.minute/60
+    else:
+        hours = solarTimeHours(index,longitude)
+    return (np.asarray(hours) >= 12).astype(np.intp)
+
+def dayPartStatistics(data,longitude=None,how='mean'):
+    '''
+    Morning and afternoon mean (or sum, how='sum') of every day, in one grouped pass.
+
+    data is a Series or a DataFrame (e.g. one column per site) and the day is split
+    at solar noon for longitude (one value, or one per column), or at 12:00 clock
+    time without one. Missing values are skipped. Returns a DataFrame indexed by
+    date with DAY_PARTS columns, under each of data's columns for a DataFrame.
+    '''
+    series = isinstance(data,pd.Series)
+    frame = data.to_frame() if series else data
+    index = pd.DatetimeIndex(frame.index)
+    values = frame.to_numpy(dtype=float)
+    nColumns = values.shape[1]
+
+    days,dayIndex = pd.factorize(index.normalize(),sort=True)
+    if longitude is None or np.ndim(longitude) == 0:
+        parts = np.repeat(dayPartCodes(index,longitude)[:,None],nColumns,axis=1)
+    else:
+        parts = np.column_stack([dayPartCodes(index,lon) for lon in longitude])
+
+    # One bin per (column, day, day-part)
+    nBins = len(dayIndex)*2
+    codes = (days[:,None]*2+parts)+np.arange(nColumns)*nBins
+    valid = ~np.isnan(values)
+    sums = np.bincount(codes[valid],weights=values[valid],minlength=nBins*nColumns)
+    if how == 'sum':
+        result = sums
+    elif how == 'mean':
+        counts = np.bincount(codes[valid],minlength=nBins*nColumns)
+        with np.errstate(invalid='ignore',divide='ignore'):
+            result = sums/counts
+    else:
+        raise ValueError(f"how must be 'mean' or 'sum', not {how}")
+
+    result = result.reshape(nColumns,len(dayIndex),2).transpose(1,0,2).reshape(len(dayIndex),-1)
+    columns = pd.MultiIndex.from_product([frame.columns,DAY_PARTS])
+    statistics = pd.DataFrame(result,index=dayIndex,columns=columns)
+    return statistics[frame.columns[0]] if series else statistics
+
+def aggregateEnergy(power,index=None,windows=None,longitude=None):
+    '''
+    Integrate each column of power (W, DataFrame or dict of arrays on index) to Wh
+    and total it by group. Returns a dict of DataFrames (one column per quantity):
+        total (a Series), month (1-12), season (SEASONS), dayPart (DAY_PARTS,
+        split at solar noon if longitude is given), and window if windows
+        ({name: (start, end)}, inclusive like .loc) are given.
+    '''
+    if index is None:
+        index = power.index
+    index = pd.DatetimeIndex(index)
+    names = list(power.keys())
+    values = np.nan_to_num(np.vstack([np.asarray(power[k],dtype=float) for k in names]))
+    energy = values*timestepHours(index)
+
+    # Every sample goes into one month x day-part bin
+    codes = (index.month.to_numpy()-1)*2+dayPartCodes(index,longitude)
+    bins = np.vstack([np.bincount(codes,weights=e,minlength=24) for e in energy]).T.reshape(12,2,-1)
+
+    month = pd.DataFrame(bins.sum(axis=1),index=range(1,13),columns=names)
+    aggregates = dict(total=month.sum(),
+                      month=month,
+                      season=pd.DataFrame([month.loc[list(m)].sum() for m in SEASONS.values()],index=list(SEASONS)),
+                      dayPart=pd.DataFrame(bins.sum(axis=0),index=list(DAY_PARTS),columns=names))
+
+    if windows:
+        # Integral up to each sample, a window is the difference at its ends
+        cumulative = np.zeros((len(names),len(index)))
+        cumulative[:,1:] = np.cumsum((values[:,1:]+values[:,:-1])/2*intervalHours(index),axis=1)
+        rows = []
+        for name,(start,end) in windows.items():
+            positions = index.slice_indexer(start,end)
+            first,last = positions.start or 0,(len(index) if positions.stop is None else positions.stop)-1
+            if last <= first:
+                rows.append(np.zeros(len(names)))
+            else:
+                rows.append(cumulative[:,last]-cumulative[:,first])
+        aggregates['window'] = pd.DataFrame(rows,index=list(windows),columns=names)
+    return aggregates
+
+def aggregateSimulation(mcResults,consumption=None,windows=None,longitude=None):
+    '''
+    aggregateEnergy of a simulation's dc (p_mp) and ac, and if consumption is
+    given of the consumption and self-consumption. mcResults is RunSim's
+    ModelChain results or a DataFrame with p_mp and ac columns.
+    '''
+    if hasattr(mcResults,'dc'):
+        dc,ac = mcResults.dc['p_mp'],mcResults.ac
+    else:
+        dc,ac = mcResults['p_mp'],mcResults['ac']
+    ac = ac.fillna(0)
+    power = {'dc':dc.to_numpy(),'ac':ac.to_numpy()}
+    if consumption is not None:
+        consumption = np.asarray(consumption,dtype=float)
+        power['consumption'] = consumption
+        power['selfConsumption'] = selfConsumptionSeries(ac,consumption)
+    return aggregateEnergy(power,ac.index,windows,longitude)
+
+def seasonWindows(year,seasons=None):
+    '''
+    {season: (start, end)} of SEASON_WINDOWS (or only seasons) in year
+    '''
+    if seasons is None:
+        seasons = list(SEASON_WINDOWS)
+    return {season:tuple(f'{year}-{d}' for d in SEASON_WINDOWS[season]) for season in seasons}
+
+def windowBalance(dc,ac,consumption,index,windows):
+    '''
+    For each window ({name: (start, end)}, inclusive like .loc) the DC energy
+    ('dcEnergy') and energyBalance of ac against consumption, all in Wh and the
+    same as simulating only that window. dc and ac are (time,) or (batch, time)
+    on index. Returns {name: metrics dict}.
+    '''
+    index = pd.DatetimeIndex(index)
+    dc = np.asarray(dc,dtype=float)
+    ac = np.asarray(ac,dtype=float)
+    consumption = np.asarray(consumption,dtype=float)
+    balances = {}
+    for name,(start,end) in windows.items():
+        window = index.slice_indexer(start,end)
+        hours = timestepHours(index[window])
+        balances[name] = energyBalance(ac[...,window],consumption[window],hours)
+        balances[name]['dcEnergy'] = dc[...,window]@hours
+    return balances
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed May  1 10:12:45 2024
+
+@author: miran
+
+Energy balance metrics between generation and consumption.
+
+All functions take the AC output either as one series (time,) or as a batch
+(orientation, time), with consumption broadcast along the last axis, and reduce
+over time with array operations. float32 inputs are worked on in float32 but
+totalled in float64.
+"""
+
+import numpy as np
+
+from profiling import profiled
+
+
+def _arrays(ac,consumption):
+    # float32 inputs (compactStorage) stay float32, anything else becomes float64
+    ac,consumption = np.asarray(ac),np.asarray(consumption)
+    dtype = np.result_type(ac,consumption,np.float32)
+    return ac.astype(dtype,copy=False),consumption.astype(dtype,copy=False)
+
+def selfConsumptionSeries(ac,consumption):
+    '''
+    Generation used on site at each timestep, the smaller of generation and demand
+    '''
+    ac,consumption = _arrays(ac,consumption)
+    return np.where(ac>consumption,consumption,ac)
+
+@profiled('selfConsumption')
+def selfConsumption(ac,consumption):
+    '''
+    Total generation used on site
+    '''
+    return selfConsumptionSeries(ac,consumption).sum(axis=-1,dtype=float)
+
+@profiled('energyBalance')
+def energyBalance(ac,consumption,hours=None):
+    '''
+    Totals over the last (time) axis (sums of samples, or energies in Wh if hours
+    gives each timestep's weight in hours, e.g. energyAggregation.timestepHours):
+        generation, consumption, selfConsumption, export (generation not used on
+        site, "wasted"), imported (demand not met by generation), net (generation
+        minus demand), selfSufficiency (share of demand met on site) and
+        selfConsumptionRatio (share of generation used on site)
+    '''
+    ac,consumption = _arrays(ac,consumption)
+    if hours is None:
+        total = lambda x: x.sum(axis=-1,dtype=float)
+    else:
+        hours = np.asarray(hours,dtype=float)
+        total = lambda x: x@hours
+    net = ac-consumption
+    generation = total(ac)
+    demand = total(np.broadcast_to(consumption,net.shape))
+    selfCons = total(np.where(ac>consumption,consumption,ac))
+    with np.errstate(invalid='ignore',divide='ignore'):
+        metrics = dict(generation=generation,
+                       consumption=demand,
+                       selfConsumption=selfCons,
+                       export=total(np.where(net>0,net,0)),
+                       imported=total(np.where(net<0,-net,0)),
+                       net=total(net),
+                       selfSufficiency=selfCons/demand,
+                       selfConsumptionRatio=selfCons/generation)
+    return metrics
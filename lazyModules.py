@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed May 15 09:12:48 2024
+
+@author: miran
+
+Modules imported on first use.
+
+Plotting, the optimisers and the case study store pull in matplotlib, scipy
+and pyarrow, which most simulations (and every sweep worker) never touch.
+
+    plt = lazyImport('matplotlib.pyplot')
+
+binds a stand-in that imports the module the first time one of its attributes
+is used, so code written against the module needs no other change.
+"""
+
+import importlib
+
+
+class LazyModule:
+    '''
+    Stand-in for a module, imported on first attribute access
+    '''
+    def __init__(self,name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self,attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module,attr)
+
+    def __repr__(self):
+        state = 'imported' if self._module is not None else 'not imported yet'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazyImport(name):
+    return LazyModule(name)
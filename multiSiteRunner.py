@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri May 10 09:42:18 2024
+
+@author: miran
+
+Parallel, resumable orientation optimisation over many sites.
+
+Sites are optimised concurrently in a process pool and each result is written
+to its own JSON file in a checkpoint directory as soon as it finishes (written
+to a temporary file and renamed, so a crash never leaves half a result). The
+file name includes a hash of the site and run settings, so a restarted run skips
+every site already done with the same settings and only optimises the rest.
+"""
+
+import hashlib
+import json
+import os
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from RunSim import RunSim
+from simulationContext import SimulationContext
+from energyMetrics import selfConsumption
+from energyAggregation import aggregateSimulation, dayPartStatistics
+from my_functions import generateWeather, averageConsumptionData
+from lazyModules import lazyImport
+
+spo = lazyImport('scipy.optimize')
+
+# Same starting point and bounds as the single site scripts
+INITIAL_GUESS = [0,180]
+BOUNDS = ((0,90),(0,360))
+
+
+def objFSelfConsumption(variables,args):
+    """objective function, to be solved."""
+    # Unpack tuples
+    tilt,azimuth = variables[0],variables[1]
+    context = args[7]
+
+    # Run sim
+    energy,series = context.evaluate(tilt,azimuth,returnSeries=True)
+    consumption = args[6]
+    SelfConsumption_total = selfConsumption(series['ac'],consumption)
+    return -SelfConsumption_total
+
+def dayPartDifferences(allRes,weatherData,longitude=None):
+    '''
+    Mean over the days of (morning - afternoon) mean cell temperature and summed ghi,
+    split at solar noon (see energyAggregation.dayPartStatistics)
+    '''
+    temp = dayPartStatistics(allRes.cell_temperature,longitude,'mean')
+    irrad = dayPartStatistics(weatherData['ghi'],longitude,'sum')
+    return np.nanmean(temp['morning']-temp['afternoon']),np.nanmean(irrad['morning']-irrad['afternoon'])
+
+def optimiseSite(site,settings,sandiaModules=None,cecModules=None,cecInverters=None):
+    '''
+    Self-consumption optimum for one site, as a JSON-ready record.
+
+    settings holds faciality, weatherSource, start and end (and optionally freq,
+    default '1min'), the same inputs as generalisedHighLatOptimisation_selfConsumption.py.
+    '''
+    faciality = settings['faciality']
+    start,end = settings['start'],settings['end']
+    times = pd.date_range(start,end,freq=settings.get('freq','1min'))
+    weatherData = generateWeather(settings['weatherSource'],site,times,times.year[0])
+    consumption = averageConsumptionData(weatherData.index).loc[start:end][0]
+    weatherData = weatherData.loc[start:end]
+
+    context = SimulationContext(faciality,weatherData,site,sandiaModules,cecModules,cecInverters)
+    args = [faciality,sandiaModules,cecModules,cecInverters,weatherData,site,consumption,context]
+    result = spo.minimize(objFSelfConsumption,INITIAL_GUESS,args,bounds=BOUNDS)
+
+    # Cell temp and irradiation investigation
+    energy,dc,allRes = RunSim(result.x[0],result.x[1],faciality,weatherData,site,sandiaModules,cecModules,cecInverters)
+    temp,irrad = dayPartDifferences(allRes,weatherData,site.longitude)
+    aggregates = aggregateSimulation(allRes,consumption,longitude=site.longitude)
+    return dict(name=site.name,latitude=site.latitude,longitude=site.longitude,
+                fun=float(result.fun),tilt=float(result.x[0]),azimuth=float(result.x[1]),
+                nfev=int(result.nfev),success=bool(result.success),
+                temp=float(temp),irrad=float(irrad),
+                aggregates={k:json.loads(v.to_json(orient='split')) for k,v in aggregates.items()})
+
+
+class SiteCheckpoint:
+    '''
+    Directory of per-site result files, one JSON file per (site, settings)
+    '''
+    def __init__(self,checkpointDir):
+        self.checkpointDir = checkpointDir
+
+    def key(self,site,settings):
+        request = dict(settings,name=site.name,latitude=round(float(site.latitude),6),
+                       longitude=round(float(site.longitude),6))
+        digest = hashlib.sha256(json.dumps(request,sort_keys=True,default=str).encode('utf-8')).hexdigest()[:16]
+        # Keep the site name readable in the file name
+        name = re.sub(r'[^A-Za-z0-9_-]+','_',str(site.name))[:40]
+        return f'{name}_{digest}'
+
+    def path(self,key):
+        return os.path.join(self.checkpointDir,key+'.json')
+
+    def load(self,key):
+        '''
+        The saved record, or None if the site hasn't finished
+        '''
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def save(self,key,record):
+        os.makedirs(self.checkpointDir,exist_ok=True)
+        path = self.path(key)
+        tmp = path+'.'+uuid.uuid4().hex+'.tmp'
+        with open(tmp,'w') as f:
+            json.dump(record,f,indent=1)
+        os.replace(tmp,path)
+
+
+# Per-worker catalogs, set up once by _initSites
+_sites = {}
+
+def _initSites(siteTask,sandiaModules,cecModules,cecInverters):
+    _sites.update(siteTask=siteTask,catalogs=(sandiaModules,cecModules,cecInverters))
+
+def _runSite(site,settings):
+    return _sites['siteTask'](site,settings,*_sites['catalogs'])
+
+def RunSites(sites,settings,checkpointDir,sandiaModules=None,cecModules=None,cecInverters=None,
+             workers=None,siteTask=optimiseSite):
+    '''
+    Optimise every site not already in the checkpoint directory, saving each result
+    as soon as it finishes. Returns the records of all sites in the order of sites.
+
+    siteTask(site, settings, sandiaModules, cecModules, cecInverters) returns the
+    record for one site (optimiseSite by default; must be defined at module level
+    to run in the pool). workers=1 runs in this process. If a site fails, the
+    others still finish and are saved before the error is raised.
+    '''
+    checkpoint = SiteCheckpoint(checkpointDir)
+    keys = [checkpoint.key(site,settings) for site in sites]
+    records = [checkpoint.load(key) for key in keys]
+    pending = [i for i,record in enumerate(records) if record is None]
+
+    initargs = (siteTask,sandiaModules,cecModules,cecInverters)
+    errors = []
+    if workers == 1:
+        _initSites(*initargs)
+        try:
+            for i in pending:
+                try:
+                    records[i] = _runSite(sites[i],settings)
+                except Exception as error:
+                    errors.append(error)
+                    continue
+                checkpoint.save(keys[i],records[i])
+        finally:
+            _sites.clear()
+    elif pending:
+        with ProcessPoolExecutor(max_workers=workers,initializer=_initSites,initargs=initargs) as pool:
+            futures = {pool.submit(_runSite,sites[i],settings):i for i in pending}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    records[i] = future.result()
+                except Exception as error:
+                    errors.append(error)
+                    continue
+                checkpoint.save(keys[i],records[i])
+    if errors:
+        raise errors[0]
+    return records
+
+def orientationTable(records):
+    '''
+    Optimal tilt and azimuth indexed (and sorted) by latitude, as the latitude study plots them
+    '''
+    table = pd.DataFrame({'Tilt':[r['tilt'] for r in records],'Azimuth':[r['azimuth'] for r in records]},
+                         index=np.array([r['latitude'] for r in records],dtype=float))
+    return table.sort_index()
+
+def recordAggregates(record):
+    '''
+    A record's energy aggregates back as pandas objects (see energyAggregation.aggregateEnergy)
+    '''
+    aggregates = {}
+    for k,v in record['aggregates'].items():
+        if 'columns' in v:
+            aggregates[k] = pd.DataFrame(v['data'],index=v['index'],columns=v['columns'])
+        else:
+            aggregates[k] = pd.Series(v['data'],index=v['index'],name=v.get('name'))
+    return aggregates
@@ -6,84 +6,105 @@ Created on Tue Feb 20 18:16:41 2024
 """
 
 import pvlib
+import numpy as np
 import pandas as pd
-import datetime
-import matplotlib.pyplot as plt
 
 from pvlib.bifacial.pvfactors import pvfactors_timeseries
 
 from pvlib.pvsystem import PVSystem, Array, FixedMount
 from pvlib.temperature import TEMPERATURE_MODEL_PARAMETERS
 
-def ImportPVGISData(site,times,year='tmy'):
+from weatherCache import PVGIS_URL, defaultCache
+from componentCatalog import loadCatalog
+from solarGeometry import solarPosition, cachedClearSky
+from bifacialCache import IRRADIANCE_COLUMNS, defaultCache as defaultBifacialCache
+from profiling import stage
+from consumptionProfiles import loadProfile
+from tmyTimeline import TMYTimeline, yearsIndex
+from lazyModules import lazyImport
+from compactStorage import compactFrame
+
+# Only loaded by the plotting functions
+plt = lazyImport('matplotlib.pyplot')
+
+def ImportPVGISData(site,times,year='tmy',cache=None,url=PVGIS_URL):
     '''
     Import data from the PVGIS databases
 
+    Downloads go through an on-disk cache (see weatherCache.py), so repeat runs at
+    the same site don't hit the API. Pass a WeatherCache to override the default.
     '''
+    if cache is None:
+        cache = defaultCache()
+
     if year =='tmy':
-        poaData, months, inputs, meta = pvlib.iotools.get_pvgis_tmy(
-            latitude = site.latitude, 
-            longitude= site.longitude,
-            outputformat='json', 
-            usehorizon=True, 
-            userhorizon=None,
-            url= 'https://re.jrc.ec.europa.eu/api/v5_2/', 
-            map_variables=True, 
-            timeout=120
-            )
+        request = dict(source='tmy',
+                       latitude=site.latitude,
+                       longitude=site.longitude,
+                       usehorizon=True,
+                       userhorizon=None)
+        def download():
+            poaData, months, inputs, meta = pvlib.iotools.get_pvgis_tmy(
+                latitude = site.latitude, 
+                longitude= site.longitude,
+                outputformat='json', 
+                usehorizon=True, 
+                userhorizon=None,
+                url= url, 
+                map_variables=True, 
+                timeout=120
+                )
+            return poaData
+        poaData = cache.fetch(request,download)
 
-        #
+        # Lay the TMY out on the requested years (one year, or the span of times
+        # over several), without a copy of it per year
+        timeline = TMYTimeline(poaData)
         if times.year[0]==times.year[-1]:
-            poaData.index = pd.date_range("2021-01-01 00:00","2021-12-31 23:00",freq="h",tz=site.tz)
+            poaData = timeline.frame(yearsIndex(times.year[0],times.year[0],site.tz))
         else:
-            # Create index with months in correct order
-            if times.year[0]==2024:
-                end1 = datetime.datetime(times.year[0],12,30,23) 
-            else:
-                end1 = datetime.datetime(times.year[0],12,31,23)
-            start1 = datetime.datetime(times.year[0],1,1,0)
-            df1 = poaData.copy()
-            df1.index = pd.date_range(start1,end1,freq="h",tz=site.tz)
-            if times.year[-1]==2024:
-                end2 = datetime.datetime(times.year[-1],12,30,23) 
-            else:
-                end2 = datetime.datetime(times.year[-1],12,31,23)
-            start2 = datetime.datetime(times.year[-1],1,1,0)
-            df2 = poaData.copy()
-            df2.index = pd.date_range(start2,end2,freq="h",tz=site.tz)
-    
-            #Create new df with index range as specificed
-            df1 = df1.loc[times[0]:]
-            df2 = df2.loc[:times[-1]]
-            poaData = pd.concat([df1,df2])
+            poaData = timeline.span(times[0],times[-1],site.tz)
 
 
     else:
-        poaData, meta, inputs = pvlib.iotools.get_pvgis_hourly(
-            latitude = site.latitude, 
-            longitude= site.longitude,
-            # start = year, 
-            # end= year, 
-            raddatabase="PVGIS-SARAH2", 
-            components=True,
-            surface_tilt=0, 
-            surface_azimuth=180, 
-            outputformat='json', 
-            usehorizon=True, 
-            userhorizon=None, 
-            pvcalculation=False, 
-            peakpower=None,
-            pvtechchoice='crystSi', 
-            mountingplace='free', 
-            loss=0, 
-            trackingtype=0, 
-            optimal_surface_tilt=False, 
-            optimalangles=False, 
-            url='https://re.jrc.ec.europa.eu/api/v5_2/', 
-            map_variables=True, 
-            timeout=30
-            )
-    
+        # start/end are not sent to the API (see below), so they aren't part of the key either
+        request = dict(source='seriescalc',
+                       latitude=site.latitude,
+                       longitude=site.longitude,
+                       raddatabase="PVGIS-SARAH2",
+                       components=True,
+                       surface_tilt=0,
+                       surface_azimuth=180,
+                       usehorizon=True,
+                       userhorizon=None)
+        def download():
+            poaData, meta, inputs = pvlib.iotools.get_pvgis_hourly(
+                latitude = site.latitude,
+                longitude= site.longitude,
+                # start = year,
+                # end= year,
+                raddatabase="PVGIS-SARAH2",
+                components=True,
+                surface_tilt=0,
+                surface_azimuth=180,
+                outputformat='json',
+                usehorizon=True,
+                userhorizon=None,
+                pvcalculation=False,
+                peakpower=None,
+                pvtechchoice='crystSi',
+                mountingplace='free',
+                loss=0,
+                trackingtype=0,
+                optimal_surface_tilt=False,
+                optimalangles=False,
+                url=url,
+                map_variables=True,
+                timeout=30
+                )
+            return poaData
+        poaData = cache.fetch(request,download)
+
         poaData['dhi'] = poaData['poa_sky_diffuse'] + poaData['poa_ground_diffuse']
         poaData['ghi'] = poaData['dhi'] + poaData['poa_direct']
         poaData['dni'] = poaData['poa_direct']
@@ -91,41 +112,77 @@ def ImportPVGISData(site,times,year='tmy'):
     return poaData
 
 #---------------------------------------------------------------------------------
-def generateWeather(weatherSource,site,times,year):
+def syntheticWeather(site,times,seed=0,cloudiness=0.6,solarPositionMethod=None):
+    """
+    Reproducible weather without PVGIS: clear sky irradiance attenuated by a random
+    hourly cloud factor (interpolated to times), with a seasonal and daily air
+    temperature cycle and light wind
+    """
+    clearSky = cachedClearSky(site,times,solarPositionMethod)
+    zenith = solarPosition(site,times,solarPositionMethod)['apparent_zenith'].to_numpy()
+    rng = np.random.default_rng(seed)
+
+    # Cloud factor and wind speed change hourly
+    nodes = pd.date_range(times[0].floor('h'),times[-1].ceil('h'),freq='h')
+    cloud = np.interp(times.asi8,nodes.asi8,1-cloudiness*rng.random(len(nodes)))
+    wind = np.interp(times.asi8,nodes.asi8,1+3*rng.random(len(nodes)))
+
+    ghi = clearSky['ghi'].to_numpy()*cloud
+    # Beam irradiance is attenuated more than the total
+    dni = clearSky['dni'].to_numpy()*cloud**2
+    dhi = np.maximum(ghi-dni*np.maximum(np.cos(np.radians(zenith)),0),0)
+
+    day = times.dayofyear.to_numpy()
+    hour = times.hour.to_numpy()+times.minute.to_numpy()/60
+    tempAir = 9+5*np.sin(2*np.pi*(day-110)/365)+3*np.sin(2*np.pi*(hour-9)/24)
+    return pd.DataFrame({'ghi':ghi,'dni':dni,'dhi':dhi,'temp_air':tempAir,'wind_speed':wind},index=times)
+
+#---------------------------------------------------------------------------------
+def generateWeather(weatherSource,site,times,year,cache=None,solarPositionMethod=None,dtype=None):
     # Generate weatehr data from the PVGIS database
+    # Solar geometry is memoised per site and time index (see solarGeometry.py),
+    # solarPositionMethod='ephemeris' is faster and within ~0.01 deg of zenith
+    # dtype=np.float32 stores the weather compactly (see compactStorage.py)
     if weatherSource == 'clearSky':
         print('Clear sky model used to generate weather data')
-        weatherData = site.get_clearsky(times)
+        weatherData = cachedClearSky(site,times,solarPositionMethod)
+
+    elif weatherSource == 'synthetic':
+        # Offline and reproducible, for tests and benchmarks
+        weatherData = syntheticWeather(site,times,solarPositionMethod=solarPositionMethod)
         
     elif weatherSource == 'tmy':
         # print('Typical Metrological Year weather data used')
-        weatherData = ImportPVGISData(site,times,year='tmy')
+        weatherData = ImportPVGISData(site,times,year='tmy',cache=cache)
         times = weatherData.index
 
     else:
         print(f"Weather data for the year {year} used")
-        weatherData = ImportPVGISData(site,times,year)
+        weatherData = ImportPVGISData(site,times,year,cache=cache)
         
     # Insert solar positions into the weatehr data dataframe for bifacial modelling
-    solar_position = site.get_solarposition(times)
+    solar_position = solarPosition(site,times,solarPositionMethod)
     weatherData.insert(len(weatherData.columns),'apparent_zenith',solar_position['apparent_zenith'])
     weatherData.insert(len(weatherData.columns),'azimuth',solar_position['azimuth'])
     
+    if dtype is not None:
+        weatherData = compactFrame(weatherData,dtype)
     return weatherData
 
 #---------------------------------------------------------------------------------
-def CaseStudyMPVChain(poaData,panels,tilt,azimuth,sandiaModules=None,cecModules=None,cecInverters=None,bifaciality=0.95):
+def CaseStudyMPVChain(poaData,panels,tilt,azimuth,sandiaModules=None,cecModules=None,cecInverters=None,bifaciality=0.95,irradiance=True):
     """
     Case study system modelchain setup
+    irradiance=False only builds the system and skips the bifacial irradiance model
     """
     
-    # Retrieve system components
+    # Retrieve system components (records are loaded lazily from the local catalog)
     if sandiaModules is None:
-        sandiaModules = pvlib.pvsystem.retrieve_sam('SandiaMod')
+        sandiaModules = loadCatalog('SandiaMod')
     if cecModules is None:
-        cecModules = pvlib.pvsystem.retrieve_sam(path = 'https://raw.githubusercontent.com/NREL/SAM/patch/deploy/libraries/CEC%20Modules.csv')
+        cecModules = loadCatalog('CECModules')
     if cecInverters is None:
-        cecInverters = pvlib.pvsystem.retrieve_sam('CECInverter')
+        cecInverters = loadCatalog('CECInverter')
     
     # Select temperature model
     temperatureParameters = TEMPERATURE_MODEL_PARAMETERS['sapm']['open_rack_glass_glass']
@@ -178,33 +235,9 @@ def CaseStudyMPVChain(poaData,panels,tilt,azimuth,sandiaModules=None,cecModules=
                     strings = 2)
         ]
         
-        # Define bifacial parameters
-        gcr = 0.1
-        albedo = 0.3
-        axis_azimuth = azimuth+90
-        
         # Generate irradiation timeseries using pvfactors
-        irrad = pvfactors_timeseries(poaData['azimuth'],
-                                     poaData['apparent_zenith'],
-                                     azimuth,
-                                     tilt,
-                                     axis_azimuth, # because fixed tilt
-                                     poaData.index,
-                                     poaData['dni'],
-                                     poaData['dhi'],
-                                     gcr,
-                                     pvrow_height = 1,
-                                     pvrow_width = 1,
-                                     albedo=albedo
-                                     )
-        
-        # turn into pandas DataFrame
-        irrad = pd.concat(irrad, axis=1)
-        
-        # create bifacial effective irradiance using aoi-corrected timeseries values
-        irrad['effective_irradiance'] = (
-            irrad['total_abs_front'] + (irrad['total_abs_back'] * bifaciality)
-        )
+        if irradiance:
+            irrad = bifacialIrradiance(poaData,tilt,azimuth,bifaciality)
         
         
     elif panels == 'Monofacial':
@@ -264,66 +297,72 @@ def CaseStudyMPVChain(poaData,panels,tilt,azimuth,sandiaModules=None,cecModules=
     # Return dict containing information about the model
     return system,irrad
 
-#---------------------------------------------------------------------------
-def readCaseStudyData():
-    
-    fileName = ["0_Multiplus485000GX_log_20230820-1648_to_20231019-1648",
-                "0_Multiplus485000GX_log_20231019-1648_to_20231218-1548",
-                "0_Multiplus485000GX_log_20231218-1548_to_20240216-1548",
-                "0_Multiplus485000GX_log_20240216-1548_to_20240220-1547"]
-    rt = r"G:\My Drive\Uni stuff\WOrk\Notability (Y1-3)\Y4S2\FYP\Modelling\Andrews panels\\"
-    end = ".csv"
-    
-    header_rows = pd.read_csv(rt+fileName[1]+end, index_col=0,nrows=3, header=None)
-    header_rows.fillna('', inplace=True)
-    combined_header = header_rows.iloc[0] + '_' + header_rows.iloc[1] + '_' + header_rows.iloc[2]
-    
-    # Create empty dataframe
-    CaseStudyData = pd.DataFrame()
-    for x in fileName:
-        print(x)
-        # Read csv, skip rows, combine first 3 rows to a single headogn
-        toAppend = pd.read_csv(rt+x+end,index_col=0, skiprows=3,header=None)
-        CaseStudyData = pd.concat([CaseStudyData,toAppend])
+#---------------------------------------------------------------------------------
+def bifacialIrradiance(poaData,tilt,azimuth,bifaciality=0.95,gcr=0.1,albedo=0.3,
+                       pvrowHeight=1,pvrowWidth=1,cache=None):
+    """
+    Front and back irradiance of the bifacial case study array from pvfactors,
+    cached per orientation, row geometry, albedo and weather
+    """
+    if cache is None:
+        cache = defaultBifacialCache()
+    
+    def compute():
+        # Generate irradiation timeseries using pvfactors
+        with stage('pvfactors_timeseries'):
+            irrad = pvfactors_timeseries(poaData['azimuth'],
+                                         poaData['apparent_zenith'],
+                                         azimuth,
+                                         tilt,
+                                         azimuth+90, # axis azimuth, because fixed tilt
+                                         poaData.index,
+                                         poaData['dni'],
+                                         poaData['dhi'],
+                                         gcr,
+                                         pvrow_height = pvrowHeight,
+                                         pvrow_width = pvrowWidth,
+                                         albedo=albedo
+                                         )
+        return [i.to_numpy() for i in irrad]
+    
+    key = cache.key(poaData,tilt,azimuth,gcr,albedo,pvrowHeight,pvrowWidth)
+    values = cache.fetch(key,compute)
+    
+    # turn into pandas DataFrame
+    irrad = pd.DataFrame(values.T,index=poaData.index,columns=IRRADIANCE_COLUMNS)
+    
+    # create bifacial effective irradiance using aoi-corrected timeseries values
+    irrad['effective_irradiance'] = (
+        irrad['total_abs_front'] + (irrad['total_abs_back'] * bifaciality)
+    )
+    return irrad
 
-    CaseStudyData.columns = combined_header
-    CaseStudyData.index = pd.to_datetime(CaseStudyData.index)
-    return CaseStudyData
+#---------------------------------------------------------------------------
+def readCaseStudyData(columns=None,start=None,end=None,sourceDir=None,storeDir=None):
+    """
+    Victron GX logs of the case study site. New exports in sourceDir are streamed
+    into the columnar store first, then only the requested columns and time range
+    are read back.
+    """
+    from caseStudyStore import ingestCaseStudyLogs
+    store,added = ingestCaseStudyLogs(sourceDir,storeDir)
+    for fileName,rows in added.items():
+        print(fileName,rows)
+    return store.load(columns,start,end)
 
 def averageConsumptionData(times):
-    # Average consumption data exptracted form plot in report.
-    summer = [322.9741931,286.7924528,284.2767296,249.0566038,
-              251.572327,236,221.3836478,314.4654088,437.7358491,
-              447.7987421,430.1886792,442.7672956,455.3459119,
-              394.9685535,379.8742138,407.5471698,440.2515723,
-              500.6289308,533.3333333,538.3647799,535.8490566,
-              525.7,515.7232704,454.6504296
-              ]
-    winter = [682.8230953,561.0062893,387.4213836,334.591195,
-              364.7798742,374.3,384.0826487,493.081761,
-              679.245283,681.7610063,727.0440252,711.9496855,
-              729.5597484,759.7484277,769.8113208,767.2955975,
-              880.5031447,1091.823899,1122.012579,1081,
-              1041.509434,996.2264151,903.1446541,832.7044025
-              ]
-    average = [460.7151931,308.1419624,265.5532359,240.5010438,
-               263.0480167,245.5114823,270.5636743,375.782881,
-               503.5490605,508.559499,503.5490605,483.5073069,
-               503.5490605,483.5073069,458.4551148,481.0020877,
-               546.1377871,648.8517745,731.5240084,722.7,
-               713.9874739,681.4196242,611.2734864,558.6638831
-               ]
-
-    year = winter*(28+31)
-    year.extend(average*(31*2+30))
-    year.extend(summer*(31*2+30))
-    year.extend(average*(30*2+31))
-    year.extend(winter*31)
-    
-    consumptionData = pd.DataFrame(year,times)
+    # Average consumption data exptracted form plot in report, looked up by the
+    # season, day type and hour of each timestamp (see consumptionProfiles.py)
+    consumptionData = pd.DataFrame(loadProfile(times),times)
     return consumptionData
 #-------------------------------------------------------------------------------
 def plotCaseStudyData(CaseStudyData,weatherData):    
+    # Deduplicate and average once, every figure reads from the cleaned dataset
+    from caseStudyStore import CaseStudyDataset
+    if not isinstance(CaseStudyData,CaseStudyDataset):
+        CaseStudyData = CaseStudyDataset(data=CaseStudyData)
+    hourly = CaseStudyData.hourly
+    
     figRt = "../../Reporting/pyplots/"
     figName = "Solar charger properties"
     fig,ax1 = plt.subplots(figsize=(10,6))
@@ -334,8 +373,7 @@ def plotCaseStudyData(CaseStudyData,weatherData):
     outputData = pd.DataFrame(columns=plotCols)
     color = 'tab:red'
     for col in plotCols:
-        pd.to_numeric(CaseStudyData[col])
-        outputData[col] = CaseStudyData[col].resample('H').mean()
+        outputData[col] = hourly[col]
         ax1.plot(outputData[col], color=color)
     ax1.set_xlabel('Date')
     ax1.set_ylabel('PV power (W)')
@@ -348,10 +386,7 @@ def plotCaseStudyData(CaseStudyData,weatherData):
     color = 'tab:blue'
     for col in plotCols:
         print(col)
-        pd.to_numeric(CaseStudyData[col])
-        outputData = CaseStudyData[~CaseStudyData.index.duplicated(keep='first')]
-        outputData = outputData[col].dropna()
-        outputData = outputData.resample('H').mean()
+        outputData = hourly[col]
         ax2.plot(outputData, color=color,alpha=0.5)
     ax2.set_ylabel('Battery state of charge (%)')  # we already handled the x-label with ax1
     # ax2.tick_params(axis='y', labelcolor=color)
@@ -370,8 +405,7 @@ def plotCaseStudyData(CaseStudyData,weatherData):
     outputData = pd.DataFrame(columns=plotCols)
     color = 'tab:red'
     for col in plotCols:
-        pd.to_numeric(CaseStudyData[col])
-        outputData[col] = CaseStudyData[col].resample('H').mean()
+        outputData[col] = hourly[col]
         ax1.plot(outputData[col], color=color)
     ax1.set_xlabel('Date')
     ax1.set_ylabel('PV power (W)')
@@ -384,8 +418,7 @@ def plotCaseStudyData(CaseStudyData,weatherData):
     color = 'tab:blue'
     for col in plotCols:
         print(col)
-        outputData = CaseStudyData[~CaseStudyData.index.duplicated(keep='first')]
-        outputData = outputData[col].dropna()
+        outputData = CaseStudyData.channel(col)
         ax2.plot(outputData, color=color,alpha=0.5)
     ax2.set_ylabel('Charging state')  # we already handled the x-label with ax1
     # ax2.tick_params(axis='y', labelcolor=color)
@@ -404,8 +437,7 @@ def plotCaseStudyData(CaseStudyData,weatherData):
     outputData = pd.DataFrame(columns=plotCols)
     color = 'tab:red'
     for col in plotCols:
-        pd.to_numeric(CaseStudyData[col])
-        outputData[col] = CaseStudyData[col].resample('H').mean()
+        outputData[col] = hourly[col]
         ax1.plot(outputData[col], color=color)
     ax1.set_xlabel('Date')
     ax1.set_ylabel('PV power (W)')
@@ -418,9 +450,7 @@ def plotCaseStudyData(CaseStudyData,weatherData):
     color = 'tab:blue'
     for col in plotCols:
         print(col)
-        outputData = CaseStudyData[~CaseStudyData.index.duplicated(keep='first')]
-        outputData = outputData.apply(pd.to_numeric, errors='coerce')
-        outputData = outputData[col].dropna()
+        outputData = CaseStudyData.channel(col,numeric=True)
         ax2.plot(outputData, color=color,alpha=0.5)
     ax2.set_ylabel('Solar irradiance')  # we already handled the x-label with ax1
     # ax2.tick_params(axis='y', labelcolor=color)
@@ -439,8 +469,7 @@ def plotCaseStudyData(CaseStudyData,weatherData):
     outputData = pd.DataFrame(columns=plotCols)
     color = 'tab:red'
     for col in plotCols:
-        pd.to_numeric(CaseStudyData[col])
-        outputData[col] = CaseStudyData[col].resample('H').mean()
+        outputData[col] = hourly[col]
         ax1.plot(outputData[col], color=color)
     ax1.set_xlabel('Date')
     ax1.set_ylabel('PV power (W)')
@@ -453,9 +482,7 @@ def plotCaseStudyData(CaseStudyData,weatherData):
     color = 'tab:blue'
     for col in plotCols:
         print(col)
-        outputData = CaseStudyData[~CaseStudyData.index.duplicated(keep='first')]
-        outputData = outputData.apply(pd.to_numeric, errors='coerce')
-        outputData = outputData[col].dropna()
+        outputData = CaseStudyData.channel(col,numeric=True)
         ax2.plot(outputData, color=color,alpha=0.5)
     ax2.set_ylabel('Current (A)')  # we already handled the x-label with ax1
     # ax2.tick_params(axis='y', labelcolor=color)
@@ -474,8 +501,7 @@ def plotCaseStudyData(CaseStudyData,weatherData):
     outputData = pd.DataFrame(columns=plotCols)
     color = 'tab:red'
     for col in plotCols:
-        pd.to_numeric(CaseStudyData[col])
-        outputData[col] = CaseStudyData[col].resample('H').mean()
+        outputData[col] = hourly[col]
         ax1.plot(outputData[col], color=color)
     ax1.set_xlabel('Date')
     ax1.set_ylabel('PV power (W)')
@@ -488,9 +514,7 @@ def plotCaseStudyData(CaseStudyData,weatherData):
     color = 'tab:blue'
     for col in plotCols:
         print(col)
-        outputData = CaseStudyData[~CaseStudyData.index.duplicated(keep='first')]
-        outputData = outputData.apply(pd.to_numeric, errors='coerce')
-        outputData = outputData[col].dropna()
+        outputData = CaseStudyData.channel(col,numeric=True)
         ax2.plot(outputData, color=color,alpha=0.5)
     ax2.set_ylabel('_Voltage_V')  # we already handled the x-label with ax1
     # ax2.tick_params(axis='y', labelcolor=color)
@@ -509,8 +533,7 @@ def plotCaseStudyData(CaseStudyData,weatherData):
     outputData = pd.DataFrame(columns=plotCols)
     color = 'tab:red'
     for col in plotCols:
-        pd.to_numeric(CaseStudyData[col])
-        outputData[col] = CaseStudyData[col].resample('H').mean()
+        outputData[col] = hourly[col]
         ax1.plot(outputData[col], color=color)
     ax1.set_xlabel('Date')
     ax1.set_ylabel('PV power (W)')
@@ -523,9 +546,7 @@ def plotCaseStudyData(CaseStudyData,weatherData):
     color = 'tab:blue'
     for col in plotCols:
         print(col)
-        outputData = CaseStudyData[~CaseStudyData.index.duplicated(keep='first')]
-        outputData = outputData.apply(pd.to_numeric, errors='coerce')
-        outputData = outputData[col].dropna()
+        outputData = CaseStudyData.channel(col,numeric=True)
         ax2.plot(outputData, color=color,alpha=0.5)
     ax2.set_ylabel('User yield_kWh')  # we already handled the x-label with ax1
     # ax2.tick_params(axis='y', labelcolor=color)
@@ -536,9 +557,7 @@ def plotCaseStudyData(CaseStudyData,weatherData):
     #--------------------------------------------------------------------------
     # Plot solcast (case study) irradiance vs PVGIS irradiance
     plt.figure(figsize=(10,6))
-    outputData = CaseStudyData[~CaseStudyData.index.duplicated(keep='first')]
-    outputData = outputData.apply(pd.to_numeric, errors='coerce')
-    outputData = outputData['Gateway [0]_Solar Irradiance_'].dropna()
+    outputData = CaseStudyData.channel('Gateway [0]_Solar Irradiance_',numeric=True)
     plt.plot(outputData,label='Solcast (case study)',alpha=0.5)
     PVGIS = weatherData['ghi']
     plt.plot(PVGIS,alpha=0.5)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat May 11 10:05:26 2024
+
+@author: miran
+
+Offline inputs for benchmarks and tests.
+
+fixtureCatalog.json holds the few module and inverter records the case study
+systems use, frozen so nothing is downloaded from GitHub. Modules that aren't in
+pvlib's bundled SAM tables (the Merlin and JA Solar panels) are stand-ins with a
+similar rating and temperature coefficient, listed under 'standIns' with the
+record they were copied from. Weather comes from the synthetic source of
+generateWeather instead of PVGIS.
+"""
+
+import json
+import os
+
+import pandas as pd
+from pvlib.location import Location
+
+from my_functions import generateWeather
+
+FIXTURE_CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)),'fixtureCatalog.json')
+
+CASE_STUDY_SITE = Location(latitude=56.82626812132033, longitude=-5.787276786944142, name='Case Study Site')
+
+
+def frozenCatalogs(path=None):
+    '''
+    (sandiaModules, cecModules, cecInverters) DataFrames of the frozen records,
+    new copies on every call
+    '''
+    with open(FIXTURE_CATALOG if path is None else path) as f:
+        catalog = json.load(f)
+    return tuple(pd.DataFrame(catalog[database]) for database in ('SandiaMod','CECModules','CECInverter'))
+
+def standIns(path=None):
+    '''
+    {database: {name used by the model: bundled record it was copied from}}
+    '''
+    with open(FIXTURE_CATALOG if path is None else path) as f:
+        return json.load(f)['standIns']
+
+def fixtureWeather(start='2021-01-01',end='2021-12-31 23:00',freq='h',site=None):
+    '''
+    Synthetic weather with solar position, the same columns as generateWeather
+    '''
+    if site is None:
+        site = CASE_STUDY_SITE
+    times = pd.date_range(start,end,freq=freq,tz=site.tz)
+    return generateWeather('synthetic',site,times,times.year[0])
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon May  6 10:26:33 2024
+
+@author: miran
+
+Orientation optimisers and convergence recording.
+
+surrogateOptimise fits a radial basis function surface to a small Latin hypercube
+design of real simulations, finds the optimum of the surface, and refines it with
+a few more real simulations at the predicted optima. The tilt/azimuth surface is
+smooth, so this needs tens of simulations instead of the thousands used by
+multi-start L-BFGS-B with finite difference gradients.
+
+For multi-start runs, multiStartOptimise spreads the restarts over a process pool
+and MemoisedObjective avoids re-simulating points the optimiser has already seen.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from lazyModules import lazyImport
+
+# scipy's optimisers, interpolators and samplers are loaded on first use
+spo = lazyImport('scipy.optimize')
+interpolate = lazyImport('scipy.interpolate')
+qmc = lazyImport('scipy.stats.qmc')
+
+
+# Create object to store optimisation results
+class OptimizationData:
+    def __init__(self):
+        self.iter_values = []
+
+    def record_iteration(self, energy):
+        self.iter_values.append(energy)
+
+
+def _searchSurface(surface,lower,upper,gridPoints=41):
+    '''
+    Minimum of the fitted surface within the box [lower, upper], coarse grid then polished
+    '''
+    axes = [np.linspace(lo,hi,gridPoints) for lo,hi in zip(lower,upper)]
+    grid = np.stack([g.ravel() for g in np.meshgrid(*axes,indexing='ij')],axis=1)
+    start = grid[np.argmin(surface(grid))]
+    polished = spo.minimize(lambda u: surface(u.reshape(1,-1))[0],start,
+                            bounds=list(zip(lower,upper)),method='L-BFGS-B')
+    return np.clip(polished.x,lower,upper)
+
+def surrogateOptimise(fun,bounds,args=(),nInitial=16,nRefine=12,xtol=1e-3,seed=None,
+                      data=None,kernel='quintic'):
+    '''
+    Minimise fun(x, *args) within bounds with an RBF surrogate.
+
+    nInitial real simulations on a Latin hypercube design are followed by up to
+    nRefine simulations at the surrogate optimum within a box around the best
+    point so far. The box shrinks when a refinement doesn't improve, and the search
+    stops once it is smaller than xtol (as a fraction of each bound range).
+    After the design and after each refinement -best is passed to
+    data.record_iteration (the maximised quantity, as in Minimize.py's callback).
+    Returns an OptimizeResult with x, fun, nfev (simulations used), nit and trace.
+    '''
+    if not isinstance(args,tuple):
+        args = (args,)
+    if data is None:
+        data = OptimizationData()
+    bounds = np.asarray(bounds,dtype=float)
+    lower,span = bounds[:,0],bounds[:,1]-bounds[:,0]
+    dims = len(bounds)
+
+    points = []
+    values = []
+    def simulate(u):
+        points.append(u)
+        values.append(float(fun(lower+u*span,*args)))
+
+    design = qmc.LatinHypercube(d=dims,seed=seed).random(nInitial)
+    for u in design:
+        simulate(u)
+    data.record_iteration(-min(values))
+
+    # Refine inside a box around the best point, shrinking it when the surrogate
+    # stops predicting improvements
+    radius = 0.25
+    nit = 0
+    message = 'Maximum number of refinements reached'
+    while nit < nRefine:
+        # Normalise the values so the smoothing term doesn't depend on their scale
+        y = np.asarray(values)
+        scale = y.std() if y.std() > 0 else 1.
+        surface = interpolate.RBFInterpolator(np.asarray(points),(y-y.mean())/scale,kernel=kernel,smoothing=1e-9)
+        best = points[int(np.argmin(values))]
+        candidate = _searchSurface(surface,np.clip(best-radius,0,1),np.clip(best+radius,0,1))
+        if np.min(np.max(np.abs(np.asarray(points)-candidate),axis=1)) < xtol:
+            radius /= 2
+            if radius < xtol:
+                message = 'Surrogate optimum already simulated'
+                break
+            continue
+        nit += 1
+        previous = min(values)
+        simulate(candidate)
+        if values[-1] >= previous:
+            radius /= 2
+        data.record_iteration(-min(values))
+    best = int(np.argmin(values))
+    return spo.OptimizeResult(x=lower+points[best]*span,fun=values[best],nfev=len(values),nit=nit,
+                              success=True,message=message,trace=data.iter_values,
+                              X=lower+np.asarray(points)*span,Y=np.asarray(values))
+
+
+class MemoisedObjective:
+    '''
+    Objective wrapper that remembers every evaluation.
+
+    Values are keyed on x rounded to decimals plus key (e.g. faciality and
+    scenario), so the optimiser callback and repeated points across restarts
+    don't rerun the simulation. decimals must resolve the finite difference step
+    (~1e-8) or gradients would come back as zero.
+    '''
+    def __init__(self,fun,key=(),decimals=10):
+        self.fun = fun
+        self.key = tuple(key)
+        self.decimals = decimals
+        self.values = {}
+        self.evaluations = 0
+        self.hits = 0
+
+    def __call__(self,x,*args):
+        k = tuple(np.round(np.asarray(x,dtype=float),self.decimals))+self.key
+        if k in self.values:
+            self.hits += 1
+            return self.values[k]
+        self.evaluations += 1
+        value = float(self.fun(x,*args))
+        self.values[k] = value
+        return value
+
+    def recorder(self,data,args=()):
+        '''
+        Callback recording -fun(xk) (the maximised quantity) from the memo
+        '''
+        if not isinstance(args,tuple):
+            args = (args,)
+        def callback(xk,*unused):
+            data.record_iteration(-self(xk,*args))
+        return callback
+
+
+# Per-worker objective, set up once by _initRestarts
+_restarts = {}
+
+def _initRestarts(fun,args,key,bounds,method):
+    _restarts.update(objective=MemoisedObjective(fun,key),args=args,bounds=bounds,method=method)
+
+def _runRestart(start):
+    objective = _restarts['objective']
+    args = _restarts['args']
+    data = OptimizationData()
+    evaluations = objective.evaluations
+    result = spo.minimize(objective,start,args=args,bounds=_restarts['bounds'],
+                          method=_restarts['method'],callback=objective.recorder(data,args))
+    result.x0 = np.asarray(start,dtype=float)
+    result.trace = data.iter_values
+    # Simulations actually run for this restart (nfev includes memo hits)
+    result.simulations = objective.evaluations-evaluations
+    # The inverse Hessian operator doesn't need to come back to the parent
+    result.pop('hess_inv',None)
+    return result
+
+def multiStartOptimise(fun,bounds,starts,args=(),key=(),workers=None,method='L-BFGS-B'):
+    '''
+    Run scipy.optimize.minimize from each start in a process pool, each worker
+    keeping a MemoisedObjective for all its restarts. Returns the best result and
+    the list of results in the order of starts, each with .x0, .trace (recorded as
+    OptimizationData) and .simulations. workers=1 runs in this process.
+    '''
+    if not isinstance(args,tuple):
+        args = (args,)
+    initargs = (fun,args,tuple(key),bounds,method)
+    if workers == 1:
+        _initRestarts(*initargs)
+        try:
+            results = [_runRestart(start) for start in starts]
+        finally:
+            _restarts.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=workers,initializer=_initRestarts,initargs=initargs) as pool:
+            results = list(pool.map(_runRestart,starts))
+    best = min(results,key=lambda r: r.fun)
+    return best,results
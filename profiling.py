@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun May 12 10:14:03 2024
+
+@author: miran
+
+Opt-in per-stage timing for RunSim, the sweeps and the metrics.
+
+The simulation code marks its stages with
+
+    with stage('run_model'):
+        ...
+
+(or decorate a whole function with @profiled('energyBalance')), which costs one
+function call and a shared no-op context when profiling is off.
+Inside a profiling() block every stage is recorded with its wall time, the net
+memory it allocated and its peak memory (traced with tracemalloc when
+memory=True). Sweeps running in a process pool send their workers' records back
+to the profiler of the parent, so one profile covers the whole sweep.
+
+    with profiling(path='profile.jsonl') as profiler:
+        RunParameterSweep(...)
+    print(profiler.summary())
+"""
+
+import functools
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Profiler recording stages in this process, None when profiling is off
+_active = None
+
+
+class _NullStage:
+    def __enter__(self):
+        return None
+
+    def __exit__(self,*exc):
+        return False
+
+_NULL = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('profiler','name','info','start','memory','peak')
+
+    def __init__(self,profiler,name,info):
+        self.profiler = profiler
+        self.name = name
+        self.info = info
+
+    def __enter__(self):
+        stack = self.profiler._stack
+        if self.profiler.memory:
+            current,peak = tracemalloc.get_traced_memory()
+            # Keep the enclosing stage's peak before resetting it for this one
+            if stack:
+                stack[-1].peak = max(stack[-1].peak,peak)
+            tracemalloc.reset_peak()
+            self.memory = current
+            self.peak = current
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self,*exc):
+        seconds = time.perf_counter()-self.start
+        stack = self.profiler._stack
+        stack.pop()
+        record = dict(stage=self.name,seconds=seconds,pid=os.getpid(),**self.info)
+        if self.profiler.memory:
+            current,peak = tracemalloc.get_traced_memory()
+            peak = max(self.peak,peak)
+            record['allocatedMB'] = (current-self.memory)/1e6
+            record['peakMB'] = (peak-self.memory)/1e6
+            if stack:
+                stack[-1].peak = max(stack[-1].peak,peak)
+        self.profiler.records.append(record)
+        return False
+
+
+class StageProfiler:
+    '''
+    Records of every profiled stage: stage, seconds, pid, any keyword information
+    given to stage(), and allocatedMB/peakMB with memory=True
+    '''
+    def __init__(self,memory=False):
+        self.memory = memory
+        self.records = []
+        self._stack = []
+        # Whether enable() started tracemalloc for this profiler (and disable() stops it)
+        self._startedTracing = False
+
+    def stage(self,name,**info):
+        return _Stage(self,name,info)
+
+    def extend(self,records):
+        '''
+        Add records from another profiler (e.g. a pool worker)
+        '''
+        self.records.extend(records)
+
+    def summary(self):
+        '''
+        Calls, total/mean/max seconds and memory per stage, slowest total first
+        '''
+        columns = ['calls','totalSeconds','meanSeconds','maxSeconds']
+        if not self.records:
+            return pd.DataFrame(columns=columns)
+        records = pd.DataFrame(self.records)
+        grouped = records.groupby('stage')
+        summary = pd.DataFrame({'calls':grouped.size(),
+                                'totalSeconds':grouped['seconds'].sum(),
+                                'meanSeconds':grouped['seconds'].mean(),
+                                'maxSeconds':grouped['seconds'].max()})
+        if 'allocatedMB' in records:
+            summary['allocatedMB'] = grouped['allocatedMB'].sum()
+            summary['peakMB'] = grouped['peakMB'].max()
+        return summary.sort_values('totalSeconds',ascending=False)
+
+    def exportJsonl(self,path,append=True):
+        '''
+        Write the records as JSON lines
+        '''
+        with open(path,'a' if append else 'w') as f:
+            for record in self.records:
+                f.write(json.dumps(record,default=str)+'\n')
+
+
+def stage(name,**info):
+    '''
+    Context marking a stage, a shared no-op unless profiling
+    '''
+    if _active is None:
+        return _NULL
+    return _active.stage(name,**info)
+
+def profiled(name):
+    '''
+    Decorator recording every call of a function as the stage name
+    '''
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args,**kwargs):
+            if _active is None:
+                return function(*args,**kwargs)
+            with _active.stage(name):
+                return function(*args,**kwargs)
+        return wrapper
+    return decorate
+
+def activeProfiler():
+    return _active
+
+def enable(memory=False):
+    '''
+    Start recording stages in this process, returns the profiler
+    '''
+    global _active
+    _active = StageProfiler(memory)
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _active._startedTracing = True
+    return _active
+
+def disable():
+    '''
+    Stop recording, returns the profiler that was active. tracemalloc is only
+    stopped if enable() started it, so an enclosing profiler or caller keeps tracing.
+    '''
+    global _active
+    profiler,_active = _active,None
+    if profiler is not None and profiler._startedTracing and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return profiler
+
+@contextmanager
+def profiling(memory=False,path=None):
+    '''
+    Profile the block, writing the records to path (JSON lines) at the end if given
+    '''
+    previous = _active
+    profiler = enable(memory)
+    try:
+        yield profiler
+    finally:
+        disable()
+        _restore(previous)
+        if path is not None:
+            profiler.exportJsonl(path)
+
+def _restore(profiler):
+    global _active
+    _active = profiler
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri May 17 09:48:22 2024
+
+@author: miran
+
+Orientation sweep results as one memory-mapped array.
+
+A ResultCube holds every metric of a sweep in a (faciality, tilt, azimuth,
+metric, season) array, preallocated in a .npy file and written one
+(faciality, tilt) row at a time, so an interrupted sweep keeps what it has done.
+Next to it a .json file stores the coordinates of each axis, and a small
+.rows.npy file marks the rows that have been written:
+
+    cube = sweepCube('results/caseStudy', facialityOpts, tiltOpts, aziOpts, windows)
+    results = RunParameterSweep(..., windows=windows, cube=cube)
+
+    cube = ResultCube.open('results/caseStudy')
+    cube.grid('Bifacial', 'selfCons', 'Winter')    # tilt x azimuth DataFrame
+
+Opening only maps the files, and selections read just the slices they need.
+Partial sweeps (e.g. run on different machines) are combined with mergeCubes.
+
+The .json file also keeps a signature of the sweep's inputs (weather, site,
+consumption, windows and catalogs). A cube whose signature no longer matches
+is cleared and swept again rather than resumed or replotted.
+"""
+
+import hashlib
+import json
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from sweepMetrics import METRICS
+
+DIMS = ('faciality','tilt','azimuth','metric','season')
+# Season of the metrics over the whole simulated period
+WHOLE_RUN = 'All'
+
+
+def _basePath(path):
+    return path[:-4] if path.endswith('.npy') else path
+
+
+class ResultCube:
+    '''
+    Memory-mapped (faciality, tilt, azimuth, metric, season) results, NaN where
+    not written yet
+    '''
+    def __init__(self,path,coords,values,rows,signature=None):
+        self.path = path
+        self.coords = coords
+        self.values = values
+        self.rows = rows
+        self.signature = signature
+
+    @classmethod
+    def create(cls,path,facialities,tilts,azimuths,metrics=METRICS,seasons=(WHOLE_RUN,),dtype=np.float64,
+               signature=None):
+        '''
+        New cube of NaN with these coordinates, replacing any cube at path.
+        signature (sweepSignature) records the inputs the cube is filled from.
+        '''
+        path = _basePath(path)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory,exist_ok=True)
+        coords = {dim:np.asarray(values).tolist() for dim,values in
+                  zip(DIMS,(facialities,tilts,azimuths,metrics,seasons))}
+        shape = tuple(len(coords[dim]) for dim in DIMS)
+        values = np.lib.format.open_memmap(path+'.npy',mode='w+',dtype=dtype,shape=shape)
+        values[...] = np.nan
+        rows = np.lib.format.open_memmap(path+'.rows.npy',mode='w+',dtype=bool,shape=shape[:2])
+        rows[...] = False
+        cube = cls(path,coords,values,rows,signature)
+        # Coordinates last, so a cube with a .json file is always complete on disk
+        cube._writeMeta()
+        return cube
+
+    @classmethod
+    def open(cls,path,mode='r'):
+        '''
+        Map an existing cube, read-only unless mode='r+'
+        '''
+        path = _basePath(path)
+        with open(path+'.json') as f:
+            meta = json.load(f)
+        values = np.load(path+'.npy',mmap_mode=mode)
+        rows = np.load(path+'.rows.npy',mmap_mode=mode)
+        return cls(path,meta['coords'],values,rows,meta.get('signature'))
+
+    def _writeMeta(self):
+        tmp = self.path+'.json.tmp'
+        with open(tmp,'w') as f:
+            json.dump(dict(dims=DIMS,coords=self.coords,dtype=self.values.dtype.str,
+                           signature=self.signature),f,indent=1)
+        os.replace(tmp,self.path+'.json')
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def position(self,dim,label):
+        '''
+        Index of label along dim
+        '''
+        try:
+            return self.coords[dim].index(np.asarray(label).tolist())
+        except ValueError:
+            raise KeyError(f"{label!r} is not a {dim} of this cube") from None
+
+    def sel(self,**labels):
+        '''
+        Values at the given labels (one label drops the axis, a list keeps it),
+        read from the file only for the selected slices
+        '''
+        unknown = set(labels)-set(DIMS)
+        if unknown:
+            raise ValueError(f"Unknown dimensions {sorted(unknown)}, the cube has {DIMS}")
+        key = []
+        for dim in DIMS:
+            if dim not in labels:
+                key.append(slice(None))
+            elif isinstance(labels[dim],(list,tuple,np.ndarray)):
+                key.append([self.position(dim,label) for label in labels[dim]])
+            else:
+                key.append(self.position(dim,labels[dim]))
+        # Apply list selections one axis at a time (numpy would pair them up)
+        values = self.values[tuple(k if not isinstance(k,list) else slice(None) for k in key)]
+        axis = 0
+        for k in key:
+            if isinstance(k,list):
+                values = np.take(values,k,axis=axis)
+            if not isinstance(k,int):
+                axis += 1
+        return np.asarray(values)
+
+    def grid(self,faciality,metric,season=WHOLE_RUN):
+        '''
+        Tilt x azimuth DataFrame of one metric, as RunParameterSweep returns them
+        '''
+        return pd.DataFrame(self.sel(faciality=faciality,metric=metric,season=season),
+                            index=self.coords['tilt'],columns=self.coords['azimuth'])
+
+    def writeRow(self,f,t,metrics):
+        '''
+        Store row (f, t) from {season: {metric: (azimuth,) values}}
+        '''
+        for s,season in enumerate(self.coords['season']):
+            for m,metric in enumerate(self.coords['metric']):
+                self.values[f,t,:,m,s] = metrics[season][metric]
+        self.rows[f,t] = True
+
+    def writeSweepRow(self,f,t,row):
+        '''
+        Store a RunParameterSweep row (whole-run metrics, and per window under 'windows')
+        '''
+        self.writeRow(f,t,{WHOLE_RUN:row,**row.get('windows',{})})
+        self.flush()
+
+    def checkSweep(self,facialityOpts,tiltOpts,aziOpts,windows=None,signature=None):
+        '''
+        Raise ValueError unless the cube's coordinates are those of this sweep, and
+        clear it if it was filled from other inputs than signature
+        '''
+        if self.coords != _sweepCoords(facialityOpts,tiltOpts,aziOpts,windows):
+            raise ValueError(f"The cube at {self.path} was made for a different sweep")
+        if signature is not None and signature != self.signature:
+            if np.asarray(self.rows).any():
+                warnings.warn(f"The inputs of the sweep in {self.path} have changed, running it again")
+            self.clear(signature)
+
+    def clear(self,signature=None):
+        '''
+        Mark every row unwritten (NaN) and record the inputs of the next sweep
+        '''
+        self.values[...] = np.nan
+        self.rows[...] = False
+        self.flush()
+        self.signature = signature
+        self._writeMeta()
+
+    def flush(self):
+        self.values.flush()
+        self.rows.flush()
+
+    def pending(self):
+        '''
+        (f, t) positions of the rows not written yet
+        '''
+        return [tuple(int(i) for i in p) for p in np.argwhere(~np.asarray(self.rows))]
+
+    def sweepResults(self):
+        '''
+        The cube in RunParameterSweep's layout: {metric: [grid per faciality]} for
+        the whole run and, for the other seasons, under 'windows'
+        '''
+        def grids(season):
+            return {metric:[self.grid(faciality,metric,season) for faciality in self.coords['faciality']]
+                    for metric in self.coords['metric']}
+        results = grids(WHOLE_RUN)
+        windows = [season for season in self.coords['season'] if season != WHOLE_RUN]
+        if windows:
+            results['windows'] = {season:grids(season) for season in windows}
+        return results
+
+
+def _sweepCoords(facialityOpts,tiltOpts,aziOpts,windows=None):
+    seasons = [WHOLE_RUN]+list(windows or [])
+    return {dim:np.asarray(values).tolist() for dim,values in
+            zip(DIMS,(facialityOpts,tiltOpts,aziOpts,METRICS,seasons))}
+
+def sweepSignature(weatherData,site,consumption,windows=None,sandiaModules=None,cecModules=None,cecInverters=None):
+    '''
+    Hash of everything a sweep's results depend on besides its coordinates: the
+    weather (values, columns and times), the site, the consumption, the window
+    bounds and the catalogs (every parameter of every module and inverter)
+    '''
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(weatherData.to_numpy(dtype=float)).tobytes())
+    digest.update(weatherData.index.asi8.tobytes())
+    digest.update(np.ascontiguousarray(np.asarray(consumption,dtype=float)).tobytes())
+    catalogs = []
+    for catalog in (sandiaModules,cecModules,cecInverters):
+        if catalog is None:
+            catalogs.append(None)
+            continue
+        # One row per module (named by the index), hashed with its parameters
+        digest.update(pd.util.hash_pandas_object(catalog.T,index=True).to_numpy().tobytes())
+        catalogs.append([str(name) for name in catalog.index])
+    described = dict(columns=[str(column) for column in weatherData.columns],tz=str(weatherData.index.tz),
+                     site=[site.latitude,site.longitude,str(site.tz),site.altitude],
+                     windows={name:[str(bound) for bound in bounds] for name,bounds in (windows or {}).items()},
+                     catalogs=catalogs)
+    digest.update(json.dumps(described,sort_keys=True).encode())
+    return digest.hexdigest()
+
+def sweepCube(path,facialityOpts,tiltOpts,aziOpts,windows=None,signature=None):
+    '''
+    Cube for a RunParameterSweep with these options, the existing one at path if
+    its coordinates and input signature (sweepSignature) match, to resume or
+    replot it, otherwise a new one
+    '''
+    coords = _sweepCoords(facialityOpts,tiltOpts,aziOpts,windows)
+    if os.path.exists(_basePath(path)+'.json'):
+        cube = ResultCube.open(path,mode='r+')
+        if cube.coords == coords and (signature is None or cube.signature == signature):
+            return cube
+    return ResultCube.create(path,*(coords[dim] for dim in DIMS),signature=signature)
+
+def mergeCubes(paths,path):
+    '''
+    Combine partial cubes into a new cube at path covering every coordinate of
+    each, copying one written row at a time (later cubes win where they overlap)
+    '''
+    cubes = [ResultCube.open(p) for p in paths]
+    coords = {}
+    for dim in DIMS:
+        labels = []
+        for cube in cubes:
+            labels += [label for label in cube.coords[dim] if label not in labels]
+        coords[dim] = sorted(labels) if dim in ('tilt','azimuth') else labels
+    # Keep the input signature if every partial sweep was run on the same inputs
+    signatures = {cube.signature for cube in cubes}
+    signature = signatures.pop() if len(signatures) == 1 else None
+    merged = ResultCube.create(path,*(coords[dim] for dim in DIMS),dtype=cubes[0].values.dtype,
+                               signature=signature)
+    for cube in cubes:
+        index = {dim:[merged.position(dim,label) for label in cube.coords[dim]] for dim in DIMS[2:]}
+        for f,t in np.argwhere(np.asarray(cube.rows)):
+            target = (merged.position('faciality',cube.coords['faciality'][f]),
+                      merged.position('tilt',cube.coords['tilt'][t]))
+            merged.values[target+np.ix_(index['azimuth'],index['metric'],index['season'])] = cube.values[f,t]
+            merged.rows[target] = True
+    merged.flush()
+    return merged
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu May  2 09:37:50 2024
+
+@author: miran
+
+Long-lived simulation setup for optimisers.
+
+RunSim rebuilds the components, PVSystem and ModelChain on every call, although
+only the surface tilt and azimuth change between optimiser iterations. A
+SimulationContext resolves the module, inverter, temperature model, site and
+weather once, and evaluate(tilt, azimuth) only redoes the orientation dependent
+physics.
+"""
+
+import pandas as pd
+from pvlib.modelchain import ModelChain
+
+from my_functions import CaseStudyMPVChain, bifacialIrradiance
+from solarGeometry import CachedLocation
+from sweepEngine import sweepInputs, evaluateOrientations
+from energyAggregation import integrateEnergy
+from profiling import stage
+
+# Time series returned by evaluate(..., returnSeries=True)
+SERIES = ('ac','p_mp','effective_irradiance','cell_temperature')
+
+
+class SimulationContext:
+    '''
+    Case study system at one site and weather, evaluated at any orientation.
+
+    Monofacial systems go through the vectorised engine with the orientation
+    independent inputs (solar position, extraterrestrial irradiance, weather
+    arrays) prepared once. Bifacial systems reuse one PVSystem and ModelChain and
+    only recompute the pvfactors irradiance (cached), or interpolate it from a
+    BifacialSurrogate if one is given.
+    '''
+    def __init__(self,faciality,weatherData,site,sandiaModules=None,cecModules=None,cecInverters=None,bifaciality=0.95,
+                 surrogate=None):
+        self.faciality = faciality
+        self.weatherData = weatherData
+        self.site = site
+        self.bifaciality = bifaciality
+        self.surrogate = surrogate
+        self.system,irrad = CaseStudyMPVChain(weatherData,faciality,0,180,sandiaModules,cecModules,cecInverters,
+                                              bifaciality,irradiance=False)
+        if faciality == 'Monofacial':
+            self.inputs = sweepInputs(weatherData,site)
+            self.modelchain = None
+        elif faciality == 'Bifacial':
+            self.inputs = None
+            self.modelchain = ModelChain(self.system,CachedLocation(site),aoi_model='no_loss',spectral_model="no_loss")
+        else:
+            raise ValueError(f"SimulationContext supports Monofacial and Bifacial systems, not {faciality}")
+        self.evaluations = 0
+
+    def evaluate(self,tilt,azimuth,returnSeries=False):
+        '''
+        Energy generated at (tilt, azimuth), integrated the same way as RunSim.
+        Returns (energy, series) where series is a DataFrame of SERIES if
+        returnSeries, otherwise None.
+        '''
+        self.evaluations += 1
+        tilt = float(tilt)
+        azimuth = float(azimuth)
+        if self.modelchain is None:
+            with stage('evaluateOrientations',orientations=1):
+                results = evaluateOrientations([tilt],[azimuth],self.inputs,self.system,
+                                               SERIES if returnSeries else ())
+            energy = float(results['energy'][0])
+            series = None
+            if returnSeries:
+                series = pd.DataFrame({k:results[k][0] for k in SERIES},index=self.inputs['times'])
+            return energy,series
+
+        mount = self.system.arrays[0].mount
+        mount.surface_tilt = tilt
+        mount.surface_azimuth = azimuth
+        if self.surrogate is None:
+            irrad = bifacialIrradiance(self.weatherData,tilt,azimuth,self.bifaciality)
+        else:
+            irrad = self.surrogate.irradiance(tilt,azimuth,self.bifaciality)
+        with stage('run_model_from_effective_irradiance'):
+            self.modelchain.run_model_from_effective_irradiance(irrad)
+        results = self.modelchain.results
+        with stage('integration'):
+            energy = float(integrateEnergy(results.dc['p_mp']))
+        series = None
+        if returnSeries:
+            series = pd.DataFrame({'ac':results.ac,
+                                   'p_mp':results.dc['p_mp'],
+                                   'effective_irradiance':results.effective_irradiance,
+                                   'cell_temperature':results.cell_temperature})
+        return energy,series
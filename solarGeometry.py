@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Apr 29 09:52:18 2024
+
+@author: miran
+
+Memoised solar geometry.
+
+Solar position, extraterrestrial irradiance and airmass only depend on the site
+and the time index, but generateWeather, the clear sky model and every ModelChain
+run used to recompute them. Results are kept in a small LRU cache keyed by the
+site coordinates and a hash of the time index (start, end, frequency, tz), stored
+as one float64 block per entry rather than DataFrames.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pvlib
+from pvlib.location import Location
+
+# Default solar position algorithm. 'nrel_numpy' matches pvlib/ModelChain exactly,
+# 'ephemeris' is several times faster (within ~0.01 deg of zenith), 'nrel_numba' needs numba.
+SOLAR_POSITION_METHOD = 'nrel_numpy'
+
+# Number of (site, times) entries kept, a 1-minute year is ~30 MB per entry
+MAX_ENTRIES = 8
+
+POSITION_COLUMNS = ['apparent_zenith','zenith','apparent_elevation','elevation','azimuth','equation_of_time']
+
+_cache = OrderedDict()
+stats = {'hits':0,'misses':0}
+
+
+def _hashValue(value):
+    if value is None or np.isscalar(value):
+        return value
+    values = np.ascontiguousarray(np.asarray(value,dtype=float))
+    return hashlib.sha1(values.tobytes()).hexdigest()
+
+def timesKey(times):
+    '''
+    Hashable key for a DatetimeIndex
+    '''
+    if times.freq is not None:
+        return (str(times[0]),str(times[-1]),times.freqstr,str(times.tz),len(times))
+    # Irregular index, hash the timestamps themselves
+    return (hashlib.sha1(times.asi8.tobytes()).hexdigest(),str(times.tz),len(times))
+
+def _entry(site,times,method,pressure,temperature):
+    if pressure is None:
+        pressure = pvlib.atmosphere.alt2pres(site.altitude)
+    key = (site.latitude,site.longitude,site.altitude,timesKey(times),method,
+           _hashValue(pressure),_hashValue(temperature))
+    if key in _cache:
+        stats['hits'] += 1
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    stats['misses'] += 1
+    position = pvlib.solarposition.get_solarposition(times,latitude=site.latitude,
+                                                      longitude=site.longitude,
+                                                      altitude=site.altitude,
+                                                      pressure=pressure,
+                                                      temperature=temperature,
+                                                      method=method)
+    columns = [c for c in POSITION_COLUMNS if c in position]
+    airmass = pvlib.atmosphere.get_relative_airmass(position['apparent_zenith'].to_numpy())
+    entry = dict(times=times,
+                 columns=columns,
+                 position=np.ascontiguousarray(position[columns].to_numpy().T),
+                 dni_extra=pvlib.irradiance.get_extra_radiation(times).to_numpy(),
+                 airmass_relative=airmass,
+                 airmass_absolute=pvlib.atmosphere.get_absolute_airmass(airmass,pressure))
+    _cache[key] = entry
+    while len(_cache) > MAX_ENTRIES:
+        _cache.popitem(last=False)
+    return entry
+
+def solarPosition(site,times,method=None,pressure=None,temperature=12):
+    '''
+    Cached equivalent of site.get_solarposition(times, pressure, temperature, method=method)
+    '''
+    if method is None:
+        method = SOLAR_POSITION_METHOD
+    entry = _entry(site,times,method,pressure,temperature)
+    # Copy so callers can't modify the cached block
+    return pd.DataFrame(entry['position'].T,index=times,columns=entry['columns'],copy=True)
+
+def solarGeometry(site,times,method=None,pressure=None,temperature=12):
+    '''
+    Cached solar position, extraterrestrial irradiance and airmass as numpy arrays
+    '''
+    if method is None:
+        method = SOLAR_POSITION_METHOD
+    entry = _entry(site,times,method,pressure,temperature)
+    geometry = {c:entry['position'][i] for i,c in enumerate(entry['columns'])}
+    for k in ('dni_extra','airmass_relative','airmass_absolute'):
+        geometry[k] = entry[k]
+    return geometry
+
+def cachedClearSky(site,times,method=None):
+    '''
+    site.get_clearsky(times) reusing the cached geometry
+    '''
+    geometry = solarGeometry(site,times,method)
+    return site.get_clearsky(times,
+                             solar_position=solarPosition(site,times,method),
+                             dni_extra=pd.Series(geometry['dni_extra'],index=times),
+                             airmass_absolute=pd.Series(geometry['airmass_absolute'],index=times))
+
+def clearCache():
+    _cache.clear()
+    stats['hits'] = 0
+    stats['misses'] = 0
+
+
+class CachedLocation(Location):
+    '''
+    Location whose get_solarposition goes through the cache, so ModelChain runs at the
+    same site and times only compute the solar position once. ModelChain always asks
+    for 'nrel_numpy', this uses method (or SOLAR_POSITION_METHOD) instead.
+    '''
+    def __init__(self,site,method=None):
+        super().__init__(site.latitude,site.longitude,tz=site.tz,altitude=site.altitude,name=site.name)
+        self.method = method
+
+    def get_solarposition(self,times,pressure=None,temperature=12,**kwargs):
+        kwargs.pop('method',None)
+        if kwargs:
+            return super().get_solarposition(times,pressure,temperature,method=self.method or SOLAR_POSITION_METHOD,**kwargs)
+        return solarPosition(self,times,self.method,pressure,temperature)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Apr 28 11:30:24 2024
+
+@author: miran
+
+Vectorised simulation of many (tilt, azimuth) orientations at once.
+
+Does the same steps as RunSim's Monofacial ModelChain (solar position, Hay-Davies
+transposition, no AOI/spectral loss, SAPM cell temperature, CEC single diode and
+Sandia inverter), but on 2-D arrays shaped (orientation, time) so the weather is
+only walked once for the whole batch.
+"""
+
+import numpy as np
+import pvlib
+import pvlib.singlediode
+
+from my_functions import CaseStudyMPVChain
+from solarGeometry import solarGeometry
+from energyAggregation import integrateEnergy
+from profiling import stage
+
+# Orientation x time elements evaluated per chunk, keeps peak memory bounded
+CHUNK_ELEMENTS = 2_000_000
+
+OUTPUTS = ('poa_global','cell_temperature','p_mp','ac')
+
+
+def sweepInputs(weatherData,site):
+    '''
+    Orientation independent inputs, computed once per weather dataset
+    '''
+    # Same solar position call as ModelChain.prepare_inputs, shared with RunSim through the cache
+    kwargs = {}
+    if 'pressure' in weatherData:
+        kwargs['pressure'] = weatherData['pressure']
+    if 'temp_air' in weatherData:
+        kwargs['temperature'] = weatherData['temp_air']
+    geometry = solarGeometry(site,weatherData.index,**kwargs)
+
+    n = len(weatherData)
+    inputs = dict(
+        times = weatherData.index,
+        apparent_zenith = geometry['apparent_zenith'],
+        azimuth = geometry['azimuth'],
+        dni_extra = geometry['dni_extra'],
+        dni = weatherData['dni'].to_numpy(),
+        ghi = weatherData['ghi'].to_numpy(),
+        dhi = weatherData['dhi'].to_numpy(),
+        # ModelChain defaults when the weather has no temperature/wind
+        temp_air = weatherData['temp_air'].to_numpy() if 'temp_air' in weatherData else np.full(n,20.),
+        wind_speed = weatherData['wind_speed'].to_numpy() if 'wind_speed' in weatherData else np.full(n,0.),
+        )
+    return inputs
+
+def sweepSystem(weatherData,faciality='Monofacial',sandiaModules=None,cecModules=None,cecInverters=None):
+    '''
+    Resolve module, inverter and layout through CaseStudyMPVChain so the components
+    stay the same as in RunSim
+    '''
+    if faciality != 'Monofacial':
+        raise ValueError(f"Vectorised sweeps only support Monofacial systems, not {faciality}")
+    system,irrad = CaseStudyMPVChain(weatherData,faciality,0,180,sandiaModules,cecModules,cecInverters)
+    return system
+
+def evaluateOrientations(tilt,azimuth,inputs,system,outputs=OUTPUTS):
+    '''
+    Run the model for 1-D arrays of tilt and azimuth. Returns 2-D arrays (orientation, time)
+    for each requested output and the integrated energy per orientation.
+    '''
+    array = system.arrays[0]
+    tilt = np.asarray(tilt,dtype=float).reshape(-1,1)
+    azimuth = np.asarray(azimuth,dtype=float).reshape(-1,1)
+
+    with np.errstate(invalid='ignore',divide='ignore'):
+        irrad = pvlib.irradiance.get_total_irradiance(
+            tilt,azimuth,
+            inputs['apparent_zenith'],inputs['azimuth'],
+            inputs['dni'],inputs['ghi'],inputs['dhi'],
+            dni_extra=inputs['dni_extra'],
+            albedo=array.albedo,
+            model='haydavies')
+
+        # aoi_model and spectral_model are 'no_loss'
+        fd = array.module_parameters.get('FD',1.)
+        effectiveIrradiance = irrad['poa_direct'] + fd*irrad['poa_diffuse']
+
+        cellTemperature = array.get_cell_temperature(irrad['poa_global'],
+                                                     inputs['temp_air'],inputs['wind_speed'],
+                                                     model='sapm')
+
+        params = system.calcparams_cec(effectiveIrradiance,cellTemperature)
+
+        # Only the maximum power point is needed, and only in daylight (at night
+        # ModelChain gets NaN and fills it with 0). Newton's method agrees with
+        # the default lambertw solver to ~1e-12 W on p_mp and ~1e-7 V on v_mp,
+        # but is much faster on large arrays.
+        shape = np.broadcast(effectiveIrradiance,cellTemperature).shape
+        day = np.broadcast_to(effectiveIrradiance > 0,shape)
+        vMp = np.zeros(shape)
+        pMp = np.zeros(shape)
+        # (a batch with no daylight at all is left at 0, the solver can't take empty arrays)
+        if day.any():
+            iMpDay,vMpDay,pMpDay = pvlib.singlediode.bishop88_mpp(
+                *[np.broadcast_to(p,shape)[day] for p in params],method='newton')
+
+            # Scale to the array layout, same as PVSystem.scale_voltage_current_power
+            vMp[day] = np.nan_to_num(vMpDay*array.modules_per_string)
+            pMp[day] = np.nan_to_num(pMpDay*array.modules_per_string*array.strings)
+    ac = pvlib.inverter.sandia(vMp,pMp,system.inverter_parameters)
+
+    results = dict(poa_global=irrad['poa_global'],
+                   cell_temperature=cellTemperature,
+                   effective_irradiance=effectiveIrradiance,
+                   p_mp=pMp,
+                   v_mp=vMp,
+                   ac=ac)
+    results = {k:np.broadcast_to(results[k],pMp.shape) for k in outputs}
+    # Same integration as RunSim (Wh)
+    results['energy'] = integrateEnergy(pMp,inputs['times'])
+    return results
+
+def RunSweep(tilts,azimuths,weatherData,site,sandiaModules=None,cecModules=None,cecInverters=None,
+             faciality='Monofacial',outputs=OUTPUTS,chunkSize=None):
+    '''
+    Evaluate every (tilts[i], azimuths[i]) pair on the same weather.
+
+    Returns a dict with 'energy' (orientation,) and each of outputs as a 2-D array
+    (orientation, time), plus the 'times' index shared by all of them. Pass
+    outputs=() to keep only the energy when sweeping a large grid.
+    '''
+    tilts = np.asarray(tilts,dtype=float).ravel()
+    azimuths = np.asarray(azimuths,dtype=float).ravel()
+    if tilts.shape != azimuths.shape:
+        raise ValueError("tilts and azimuths must have the same length")
+
+    with stage('sweepInputs'):
+        inputs = sweepInputs(weatherData,site)
+    with stage('CaseStudyMPVChain',faciality=faciality):
+        system = sweepSystem(weatherData,faciality,sandiaModules,cecModules,cecInverters)
+
+    nTimes = len(inputs['times'])
+    if chunkSize is None:
+        chunkSize = max(1,CHUNK_ELEMENTS//max(nTimes,1))
+
+    results = {k:np.empty((len(tilts),nTimes)) for k in outputs}
+    results['energy'] = np.empty(len(tilts))
+    for start in range(0,len(tilts),chunkSize):
+        stop = min(start+chunkSize,len(tilts))
+        with stage('evaluateOrientations',orientations=stop-start):
+            chunk = evaluateOrientations(tilts[start:stop],azimuths[start:stop],inputs,system,outputs)
+        for k in chunk:
+            results[k][start:stop] = chunk[k]
+    results['times'] = inputs['times']
+    return results
+
+def gridOrientations(tiltOpts,aziOpts):
+    '''
+    Flatten a tilt x azimuth grid into the pair arrays RunSweep expects
+    '''
+    tiltGrid,aziGrid = np.meshgrid(tiltOpts,aziOpts,indexing='ij')
+    return tiltGrid.ravel(),aziGrid.ravel()
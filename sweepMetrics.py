@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri May 17 09:31:05 2024
+
+@author: miran
+
+Metrics of an orientation sweep, shared by the sweep runner and the result cube.
+"""
+
+METRICS = ['EnergyResults','EnergyResultsNet','wastedLocs','selfCons']
+# energyBalance/windowBalance key of each metric, and whether it is maximised
+METRIC_SOURCES = {'EnergyResults':('dcEnergy',True),'EnergyResultsNet':('net',True),
+                  'wastedLocs':('export',False),'selfCons':('selfConsumption',True)}
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Apr 30 15:21:07 2024
+
+@author: miran
+
+Parallel (faciality, tilt, azimuth) parameter sweep.
+
+The weather and consumption data are copied once into shared memory and every
+worker process maps them as numpy arrays, instead of pickling the DataFrames
+with each task. Work is split into one task per (faciality, tilt) row of
+azimuths, and results come back in task order so the grids are deterministic
+whatever the number of workers.
+
+Given seasonal windows, the same annual simulation also gives every metric per
+window, so a seasonal study needs one sweep instead of one per season.
+
+Rows can also be written as they finish to a memory-mapped ResultCube
+(resultCube.py), which makes a sweep resumable and its results reusable.
+
+Run inside profiling.profiling(), the workers profile their rows too and their
+stage records are added to the profiler of the calling process.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from RunSim import RunSim
+from energyMetrics import energyBalance
+from energyAggregation import timestepHours, windowBalance
+from sweepEngine import RunSweep
+from sweepMetrics import METRICS, METRIC_SOURCES
+from resultCube import sweepSignature
+import profiling
+
+
+def _share(array):
+    '''
+    Copy an array into a new shared memory block, returns the block and how to find it
+    '''
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True,size=max(array.nbytes,1))
+    np.ndarray(array.shape,dtype=array.dtype,buffer=shm.buf)[...] = array
+    return shm,(shm.name,array.shape,array.dtype.str)
+
+def _attach(descriptor):
+    name,shape,dtype = descriptor
+    shm = shared_memory.SharedMemory(name=name)
+    return shm,np.ndarray(shape,dtype=np.dtype(dtype),buffer=shm.buf)
+
+def publishWeather(weatherData,consumption):
+    '''
+    Put the weather values, time index and consumption into shared memory
+    '''
+    blocks = []
+    descriptors = {}
+    for key,values in [('weather',weatherData.to_numpy(dtype=float)),
+                       ('index',weatherData.index.asi8),
+                       ('consumption',np.asarray(consumption,dtype=float))]:
+        shm,descriptors[key] = _share(values)
+        blocks.append(shm)
+    descriptors['columns'] = list(weatherData.columns)
+    descriptors['tz'] = None if weatherData.index.tz is None else str(weatherData.index.tz)
+    return blocks,descriptors
+
+def releaseWeather(blocks):
+    for shm in blocks:
+        shm.close()
+        shm.unlink()
+
+# Per-worker state, filled in once by _initWorker
+_worker = {}
+
+def _initWorker(descriptors,site,sandiaModules,cecModules,cecInverters,facialityOpts,tiltOpts,aziOpts,windows=None,
+                profileMemory=None):
+    # Workers record their own stages and send them back with each row
+    if profileMemory is not None:
+        profiling.enable(profileMemory)
+    blocks = []
+    shm,values = _attach(descriptors['weather'])
+    blocks.append(shm)
+    shm,asi8 = _attach(descriptors['index'])
+    blocks.append(shm)
+    shm,consumption = _attach(descriptors['consumption'])
+    blocks.append(shm)
+
+    index = pd.DatetimeIndex(asi8.view('datetime64[ns]'))
+    if descriptors['tz'] is not None:
+        index = index.tz_localize('UTC').tz_convert(descriptors['tz'])
+    # DataFrame over the shared buffer, no copy of the weather values
+    weatherData = pd.DataFrame(values,index=index,columns=descriptors['columns'],copy=False)
+
+    _worker.update(blocks=blocks,weatherData=weatherData,
+                   consumption=pd.Series(consumption,index=index,copy=False),
+                   site=site,sandiaModules=sandiaModules,cecModules=cecModules,cecInverters=cecInverters,
+                   facialityOpts=facialityOpts,tiltOpts=tiltOpts,aziOpts=aziOpts,windows=windows,
+                   profiling=profileMemory is not None)
+
+def _evaluateRow(task):
+    '''
+    All azimuths for one (faciality, tilt) pair
+    '''
+    f,t = task
+    w = _worker
+    faciality = w['facialityOpts'][f]
+    tilt = w['tiltOpts'][t]
+    with profiling.stage('sweepRow',faciality=faciality,tilt=float(tilt)):
+        row = _rowMetrics(faciality,tilt)
+    if w['profiling']:
+        profiler = profiling.activeProfiler()
+        row['profile'],profiler.records = profiler.records,[]
+    return row
+
+def _rowMetrics(faciality,tilt):
+    w = _worker
+    aziOpts = w['aziOpts']
+    weatherData = w['weatherData']
+    consumption = w['consumption']
+
+    if faciality == 'Monofacial':
+        # Whole row in one vectorised pass (same results as RunSim)
+        sweep = RunSweep(np.full(len(aziOpts),tilt),aziOpts,weatherData,w['site'],
+                         w['sandiaModules'],w['cecModules'],w['cecInverters'],
+                         outputs=('ac','p_mp') if w['windows'] else ('ac',))
+        energy = sweep['energy']
+        acRows = sweep['ac']
+        dcRows = sweep.get('p_mp')
+    else:
+        energy = np.empty(len(aziOpts))
+        acRows = np.empty((len(aziOpts),len(weatherData)))
+        dcRows = np.empty((len(aziOpts),len(weatherData)))
+        for j,azimuth in enumerate(aziOpts):
+            energy[j],dc,allRes = RunSim(tilt,azimuth,faciality,weatherData,w['site'],
+                                         w['sandiaModules'],w['cecModules'],w['cecInverters'])
+            acRows[j] = allRes.ac.to_numpy()
+            dcRows[j] = dc['p_mp'].to_numpy()
+
+    balance = energyBalance(acRows,consumption.to_numpy(),timestepHours(weatherData.index))
+    row = dict(EnergyResults=energy,
+               EnergyResultsNet=balance['net'],
+               wastedLocs=balance['export'],
+               selfCons=balance['selfConsumption'])
+    if w['windows']:
+        balances = windowBalance(dcRows,acRows,consumption.to_numpy(),weatherData.index,w['windows'])
+        row['windows'] = {name:{metric:balances[name][METRIC_SOURCES[metric][0]] for metric in METRICS}
+                          for name in balances}
+    return row
+
+def RunParameterSweep(facialityOpts,tiltOpts,aziOpts,weatherData,site,consumption,
+                      sandiaModules=None,cecModules=None,cecInverters=None,workers=None,windows=None,cube=None,
+                      signature=None):
+    '''
+    Evaluate every (faciality, tilt, azimuth) combination across a process pool.
+
+    Returns a dict with 'EnergyResults', 'EnergyResultsNet', 'wastedLocs' and
+    'selfCons', each a list (one per faciality) of DataFrames indexed by tilt with
+    azimuth columns, the same layout optimise.py used to build row by row.
+    workers=None uses every core, workers=1 runs in this process.
+    With windows ({name: (start, end)}, e.g. energyAggregation.seasonWindows)
+    results['windows'][name] has the same metrics over each window only.
+    With a cube (resultCube.sweepCube) each row is written to it as soon as it
+    arrives, rows already in it are skipped, and the results are read back from it.
+    A cube filled from other inputs (weather, site, consumption...) is swept again.
+    signature is the sweepSignature of the inputs if already computed (e.g. for sweepCube).
+    '''
+    if workers is None:
+        workers = os.cpu_count()
+    tasks = [(f,t) for f in range(len(facialityOpts)) for t in range(len(tiltOpts))]
+    if cube is not None:
+        if signature is None:
+            signature = sweepSignature(weatherData,site,consumption,windows,sandiaModules,cecModules,cecInverters)
+        cube.checkSweep(facialityOpts,tiltOpts,aziOpts,windows,signature)
+        tasks = [task for task in tasks if not cube.rows[task]]
+    initargs = (site,sandiaModules,cecModules,cecInverters,list(facialityOpts),np.asarray(tiltOpts),np.asarray(aziOpts),
+                windows)
+    profiler = profiling.activeProfiler()
+
+    rows = []
+    def collect(task,row):
+        profile = row.pop('profile',None)
+        if profiler is not None and profile is not None:
+            profiler.extend(profile)
+        if cube is not None:
+            cube.writeSweepRow(*task,row)
+        rows.append(row)
+
+    blocks,descriptors = publishWeather(weatherData,consumption)
+    try:
+        if workers == 1:
+            _initWorker(descriptors,*initargs)
+            try:
+                for task in tasks:
+                    collect(task,_evaluateRow(task))
+            finally:
+                for shm in _worker.pop('blocks'):
+                    shm.close()
+                _worker.clear()
+        elif tasks:
+            profileMemory = None if profiler is None else profiler.memory
+            with ProcessPoolExecutor(max_workers=workers,initializer=_initWorker,
+                                     initargs=(descriptors,)+initargs+(profileMemory,)) as pool:
+                # map returns results in task order
+                for task,row in zip(tasks,pool.map(_evaluateRow,tasks)):
+                    collect(task,row)
+    finally:
+        releaseWeather(blocks)
+
+    if cube is not None:
+        return cube.sweepResults()
+
+    def grids(rows):
+        results = {}
+        for metric in METRICS:
+            grid = np.empty((len(facialityOpts),len(tiltOpts),len(aziOpts)))
+            for (f,t),row in zip(tasks,rows):
+                grid[f,t] = row[metric]
+            results[metric] = [pd.DataFrame(grid[f],index=tiltOpts,columns=aziOpts) for f in range(len(facialityOpts))]
+        return results
+
+    results = grids(rows)
+    if windows:
+        results['windows'] = {name:grids([row['windows'][name] for row in rows]) for name in windows}
+    return results
+
+def gridOptima(results,facialityOpts):
+    '''
+    Best (tilt, azimuth) on the grid for every faciality and metric (least export
+    for wastedLocs, the largest value otherwise), for each window if the sweep had
+    windows. Returns a DataFrame with window, faciality, metric, tilt, azimuth, value.
+    '''
+    windows = results.get('windows',{None:results})
+    rows = []
+    for name,windowResults in windows.items():
+        for metric in METRICS:
+            maximise = METRIC_SOURCES[metric][1]
+            for faciality,grid in zip(facialityOpts,windowResults[metric]):
+                values = grid.to_numpy()
+                t,a = np.unravel_index(np.nanargmax(values) if maximise else np.nanargmin(values),values.shape)
+                rows.append(dict(window=name,faciality=faciality,metric=metric,
+                                 tilt=grid.index[t],azimuth=grid.columns[a],value=values[t,a]))
+    return pd.DataFrame(rows)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue May 14 10:02:37 2024
+
+@author: miran
+
+Typical meteorological year laid out on any span of calendar years.
+
+Every timestamp maps to a row of the one 8760 hour TMY by its day of the year
+and hour (local wall clock). In leap years 29 February repeats 28 February and
+the rest of the year lines up with the same dates as any other year. A span
+within one non-leap year is a contiguous block of rows, returned as a view of
+the TMY; anything else is gathered from it in one step, never by copying and
+concatenating the year once per calendar year.
+"""
+
+import numpy as np
+import pandas as pd
+
+HOURS = 8760
+# Day of the year (from 0) of 29 February in a leap year
+LEAP_DAY = 59
+
+
+def tmyPositions(index):
+    '''
+    Row of the TMY for each timestamp (sub-hourly timestamps take their hour's row)
+    '''
+    index = pd.DatetimeIndex(index)
+    day = index.dayofyear.to_numpy()-1
+    day = np.where(index.is_leap_year & (day >= LEAP_DAY),day-1,day)
+    return (day*24+index.hour.to_numpy()).astype(np.intp)
+
+def yearsIndex(firstYear,lastYear,tz=None):
+    '''
+    Hourly index from the start of firstYear to the end of lastYear
+    '''
+    return pd.date_range(f'{firstYear}-01-01 00:00',f'{lastYear}-12-31 23:00',freq='h',tz=tz)
+
+
+class TMYTimeline:
+    '''
+    One TMY (8760 hourly rows in calendar order) mapped onto other time indexes
+    '''
+    def __init__(self,tmy):
+        if len(tmy) != HOURS:
+            raise ValueError(f"A TMY has {HOURS} hourly rows, not {len(tmy)}")
+        self.tmy = tmy
+
+    def frame(self,index):
+        '''
+        The TMY on index, a view of its rows where they are contiguous
+        '''
+        index = pd.DatetimeIndex(index)
+        positions = tmyPositions(index)
+        if len(positions) and (np.diff(positions) == 1).all():
+            rows = self.tmy.iloc[positions[0]:positions[-1]+1]
+        else:
+            rows = self.tmy.take(positions)
+        return rows.set_axis(index,axis=0,copy=False)
+
+    def span(self,start,end,tz=None):
+        '''
+        Hourly TMY from start to end (inclusive), over as many years as needed
+        '''
+        start,end = pd.Timestamp(start),pd.Timestamp(end)
+        if tz is not None and start.tz is None:
+            start,end = start.tz_localize(tz),end.tz_localize(tz)
+        index = yearsIndex(start.year,end.year,tz)
+        return self.frame(index[index.slice_indexer(start,end)])
+
+    def years(self,firstYear,lastYear,tz=None):
+        '''
+        (year, frame) for each calendar year, views of the TMY except in leap years,
+        for long runs simulated one year at a time
+        '''
+        for year in range(firstYear,lastYear+1):
+            yield year,self.frame(yearsIndex(year,year,tz))
@@ -14,7 +14,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 from RunSim import RunSim
-from my_functions import readCaseStudyData
+from caseStudyStore import CaseStudyDataset, ingestCaseStudyLogs
 
 
 # Compare total modelled energy
@@ -37,10 +37,11 @@ ax2.set_ylabel('Total generation (Wh)',color='tab:orange')
 
 # # Check case study energy in a certain month
 # ---------------------
-CSD = readCaseStudyData()
+# New logs are ingested, then everything below reads the cleaned, pre-averaged dataset
+store,added = ingestCaseStudyLogs()
+caseStudy = CaseStudyDataset(store)
 
-month = CSD.copy()
-month = month["Solar Charger [289]_PV power_"].resample('H').mean()
+month = caseStudy.hourly["Solar Charger [289]_PV power_"]
 month = month.loc['2024-03-01 00:00:00':'2024-03-31 23:00:00']
 
 monthEnergy = np.sum(month)
@@ -49,11 +50,7 @@ print(monthEnergy)
 
 # Comparison between modelled and case study irradiance
 modelled = Main.weatherData['ghi'].copy()
-experimental = Main.CaseStudyData['Gateway [0]_Solar Irradiance_'].copy()
-
-experimental = experimental[~experimental.index.duplicated(keep='first')]
-experimental = experimental.apply(pd.to_numeric, errors='coerce')
-experimental = experimental.dropna()
+experimental = caseStudy.channel('Gateway [0]_Solar Irradiance_',numeric=True)
     
 modelled.index = modelled.index.tz_convert(None)
 
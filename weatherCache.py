@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Apr 26 10:12:37 2024
+
+@author: miran
+
+On-disk cache for weather downloaded from the PVGIS API
+"""
+
+import hashlib
+import json
+import os
+import uuid
+
+import pandas as pd
+
+PVGIS_URL = 'https://re.jrc.ec.europa.eu/api/v5_2/'
+
+# Defaults can be overridden from the environment so the driver scripts don't need editing
+CACHE_DIR = os.environ.get('PVGIS_CACHE_DIR',os.path.join(os.path.expanduser('~'),'.cache','pvgis'))
+CACHE_MAX_MB = float(os.environ.get('PVGIS_CACHE_MAX_MB',500))
+OFFLINE = os.environ.get('PVGIS_OFFLINE','0') not in ('','0','false','False')
+
+
+class OfflineCacheMiss(LookupError):
+    '''
+    Raised when the cache is offline and the requested weather has never been downloaded
+    '''
+
+
+class WeatherCache:
+    '''
+    Read-through/write-through cache of PVGIS responses stored as parquet files.
+
+    Entries are addressed by a hash of the request parameters (location, database,
+    year/TMY, horizon options), so the same request always maps to the same file.
+    When the cache grows past maxBytes the least recently used entries are removed.
+    In offline mode the network is never touched and a miss raises OfflineCacheMiss.
+    '''
+    def __init__(self,cacheDir=None,maxBytes=None,offline=None):
+        self.cacheDir = CACHE_DIR if cacheDir is None else cacheDir
+        self.maxBytes = CACHE_MAX_MB*1e6 if maxBytes is None else maxBytes
+        self.offline = OFFLINE if offline is None else offline
+        self.hits = 0
+        self.misses = 0
+
+    def key(self,request):
+        # Round coordinates so float noise doesn't create duplicate entries
+        request = dict(request)
+        for coord in ('latitude','longitude'):
+            if coord in request:
+                request[coord] = round(float(request[coord]),6)
+        text = json.dumps(request,sort_keys=True,default=str)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+    def path(self,key):
+        return os.path.join(self.cacheDir,key+'.parquet')
+
+    def get(self,key):
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        data = pd.read_parquet(path)
+        # Touch the file so eviction sees it as recently used
+        os.utime(path)
+        return data
+
+    def put(self,key,data,request=None):
+        os.makedirs(self.cacheDir,exist_ok=True)
+        path = self.path(key)
+        # Write to a temporary file first so a crash never leaves a half-written entry
+        tmp = path+'.'+uuid.uuid4().hex+'.tmp'
+        data.to_parquet(tmp,compression='zstd')
+        os.replace(tmp,path)
+        if request is not None:
+            with open(os.path.join(self.cacheDir,key+'.json'),'w') as f:
+                json.dump(request,f,sort_keys=True,default=str)
+        self.evict()
+
+    def fetch(self,request,download):
+        '''
+        Return cached data for request, calling download() and storing the result on a miss
+        '''
+        key = self.key(request)
+        data = self.get(key)
+        if data is not None:
+            self.hits += 1
+            return data
+        self.misses += 1
+        if self.offline:
+            raise OfflineCacheMiss(f"No cached PVGIS data for {request} in {self.cacheDir} (offline mode)")
+        data = download()
+        self.put(key,data,request)
+        return data
+
+    def entries(self):
+        if not os.path.isdir(self.cacheDir):
+            return []
+        return [os.path.join(self.cacheDir,f) for f in os.listdir(self.cacheDir) if f.endswith('.parquet')]
+
+    def size(self):
+        return sum(os.path.getsize(f) for f in self.entries())
+
+    def evict(self):
+        '''
+        Remove least recently used entries until the cache fits in maxBytes
+        '''
+        entries = sorted(self.entries(),key=os.path.getmtime)
+        total = sum(os.path.getsize(f) for f in entries)
+        removed = []
+        # Always keep the newest entry, even if it alone is bigger than the limit
+        while total > self.maxBytes and len(entries) > 1:
+            oldest = entries.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+            sidecar = oldest[:-len('.parquet')]+'.json'
+            if os.path.exists(sidecar):
+                os.remove(sidecar)
+            removed.append(oldest)
+        return removed
+
+    def clear(self):
+        for f in self.entries():
+            os.remove(f)
+            sidecar = f[:-len('.parquet')]+'.json'
+            if os.path.exists(sidecar):
+                os.remove(sidecar)
+
+
+_defaultCache = None
+
+def defaultCache():
+    '''
+    Shared cache used when no cache is passed to ImportPVGISData
+    '''
+    global _defaultCache
+    if _defaultCache is None:
+        _defaultCache = WeatherCache()
+    return _defaultCache